@@ -1,25 +1,49 @@
 """
 API Dependencies - Authentication and authorization middleware.
 """
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import Depends, HTTPException, Request, status
 from typing import Optional
+import hashlib
+import time
 
+from app.core.cache import TTLCache
 from app.services.auth_service import auth_service
+from app.services.tenant_service import tenant_service
+from app.models.tenant import Tenant
 from app.models.user import TokenPayload
 
-# Security scheme
-security = HTTPBearer()
+# Verified tokens, keyed by SHA-256 of the raw token (never stored in clear).
+# Entries live at most TOKEN_CACHE_TTL seconds and never past the token's exp.
+# Invalid tokens are never cached.
+TOKEN_CACHE_TTL = 30
+_token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-) -> TokenPayload:
+def bearer_token(request: Request) -> str:
+    """
+    Extract the raw token from the "Authorization: Bearer <token>" header.
+    Lighter than HTTPBearer: no credentials model built per request.
+    """
+    header = request.headers.get("authorization")
+    if not header or header[:7].lower() != "bearer " or not header[7:].strip():
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return header[7:].strip()
+
+
+async def get_current_user(token: str = Depends(bearer_token)) -> TokenPayload:
     """
     Dependency to extract and validate JWT from Authorization header.
     Returns the token payload with user info.
     """
-    token = credentials.credentials
+    cache_key = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(cache_key)
+    if payload:
+        return payload
+
     payload = auth_service.verify_token(token)
     
     if not payload:
@@ -29,6 +53,9 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"}
         )
     
+    ttl = min(TOKEN_CACHE_TTL, payload.exp - time.time())
+    if ttl > 0:
+        _token_cache.set(cache_key, payload, ttl=ttl)
     return payload
 
 
@@ -66,6 +93,18 @@ async def require_tenant_access(
     return current_user
 
 
+async def get_tenant_or_404(tenant_id: str) -> Tenant:
+    """
+    Dependency resolving the {tenant_id} path parameter to the Tenant.
+    Fetched once per request and injected into the handler.
+    Declare it after the access-check dependency so unauthorized callers get 403, not 404.
+    """
+    tenant = tenant_service.get_tenant(tenant_id)
+    if not tenant:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    return tenant
+
+
 def get_tenant_id_for_user(current_user: TokenPayload, requested_tenant_id: Optional[str] = None) -> str:
     """
     Helper to determine which tenant_id to use.
@@ -0,0 +1,111 @@
+"""
+In-process caches shared by the API and engine layers.
+Thread-safe and stdlib-only: good enough for a single worker PoC,
+swap for Redis when running multiple replicas.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry."""
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.maxsize = maxsize
+        self._on_evict = on_evict
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        evicted = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                old_key, stored = self._data.popitem(last=False)
+                evicted.append((old_key, self._unwrap(stored)))
+        self._notify(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def _unwrap(self, stored: Any) -> Any:
+        return stored
+
+    def _notify(self, evicted: list) -> None:
+        # Callbacks run outside the lock: they may do I/O (e.g. dispose engines)
+        if self._on_evict:
+            for key, value in evicted:
+                try:
+                    self._on_evict(key, value)
+                except Exception as e:
+                    logger.warning("Cache eviction callback failed for %s: %s", key, e)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire `ttl` seconds after insertion."""
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        ttl: float = 60.0,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        super().__init__(maxsize=maxsize, on_evict=on_evict)
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            with self._lock:
+                # Only drop it if nobody refreshed the entry meanwhile
+                if self._data.get(key) is entry:
+                    del self._data[key]
+            self._notify([(key, value)])
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store `value`; `ttl` overrides the cache default for this entry."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        super().set(key, (value, expires_at))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def _unwrap(self, stored: Any) -> Any:
+        return stored[0]
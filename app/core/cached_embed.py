@@ -0,0 +1,139 @@
+"""
+Persistent embedding cache.
+Re-ingesting the same documents doesn't call the embedding API again:
+document vectors are stored in SQLite, keyed by sha256(model, kind, text).
+Query embeddings are not stored: every distinct user question would add a
+row forever (repeated questions are served by the semantic answer cache).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """SQLite table of float32 vectors. One connection per process, serialized by a lock."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[bytes]) -> dict:
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update(rows)
+        return {k: np.frombuffer(v, dtype=np.float32).tolist() for k, v in found.items()}
+
+    def put_many(self, items: List[tuple]) -> None:
+        rows = [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> EmbeddingStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EmbeddingStore(settings.EMBED_CACHE_PATH)
+    return _store
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Wraps an embedding model: only cache misses reach the inner model."""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, store: Optional[EmbeddingStore] = None, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._store = store or get_embedding_store()
+
+    @classmethod
+    def wrap(cls, inner: Optional[BaseEmbedding]) -> Optional[BaseEmbedding]:
+        """Cached version of `inner` (None stays None: no embed model configured)."""
+        if inner is None or isinstance(inner, cls):
+            return inner
+        return cls(inner)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _key(self, kind: str, text: str) -> bytes:
+        # Query and document embeddings can differ for the same text (instructions, task types)
+        return hashlib.sha256(f"{self._inner.model_name}\0{kind}\0{text}".encode()).digest()
+
+    def _split(self, kind: str, texts: List[str]):
+        keys = [self._key(kind, t) for t in texts]
+        cached = self._store.get_many(keys)
+        misses = [i for i, k in enumerate(keys) if k not in cached]
+        return keys, cached, misses
+
+    def _merge(self, keys, cached, misses, computed) -> List[List[float]]:
+        self._store.put_many([(keys[i], vec) for i, vec in zip(misses, computed)])
+        cached.update((keys[i], vec) for i, vec in zip(misses, computed))
+        return [cached[k] for k in keys]
+
+    # Queries go straight to the inner model (see module docstring)
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._inner.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._inner.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, misses = self._split("text", texts)
+        computed = self._inner.get_text_embedding_batch([texts[i] for i in misses]) if misses else []
+        if misses:
+            logger.debug("Embedding cache: %d hits, %d misses", len(texts) - len(misses), len(misses))
+        return self._merge(keys, cached, misses, computed)
+
+    # Async variants run the SQLite lookups/writes in a thread: the store lock may be
+    # held by a large ingestion batch, and the event loop must not wait on it
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, misses = await asyncio.to_thread(self._split, "text", texts)
+        computed = await self._inner.aget_text_embedding_batch([texts[i] for i in misses]) if misses else []
+        if misses:
+            logger.debug("Embedding cache: %d hits, %d misses", len(texts) - len(misses), len(misses))
+        return await asyncio.to_thread(self._merge, keys, cached, misses, computed)
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import List
 import secrets
 
 class Settings(BaseSettings):
@@ -14,6 +15,17 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
 
+    # Persistent embedding cache (SQLite), shared by ingestion and query pipelines
+    EMBED_CACHE_PATH: str = "./data/embed_cache.sqlite3"
+    # Per-tenant semantic answer caches (one SQLite file per tenant)
+    SEMANTIC_CACHE_DIR: str = "./data/semantic_cache"
+    # Broker lookup filters matched by prefix instead of substring (lower(col) LIKE 'term%'):
+    # any of room_name, artist_category, technique. JSON list in the env, e.g. '["room_name"]'.
+    # Needs the prefix indexes of scripts/create_search_indexes.py
+    BROKER_PREFIX_MATCH: List[str] = []
+    # Log every SQL statement run by the query pipelines (logger app.engine.query.sql, DEBUG)
+    NOESIS_SQL_TRACE: bool = False
+
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
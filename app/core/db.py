@@ -0,0 +1,45 @@
+"""
+Shared SQLAlchemy engine management.
+Engines (and their connection pools) are reused per connection string
+instead of being created, and leaked, on every call.
+"""
+import hashlib
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from app.core.cache import LRUCache
+
+ENGINE_CACHE_SIZE = 64
+
+# sha256(uri) -> Engine. Keyed by digest so plaintext passwords aren't used as keys.
+_engines = LRUCache(maxsize=ENGINE_CACHE_SIZE, on_evict=lambda _key, engine: engine.dispose())
+_engines_lock = threading.Lock()
+
+
+def get_engine(uri: str) -> Engine:
+    """Return the pooled engine for `uri`, creating it on first use."""
+    key = hashlib.sha256(uri.encode()).digest()
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            kwargs = {"pool_pre_ping": True}
+            if not uri.startswith("sqlite"):
+                kwargs.update(pool_size=5, max_overflow=5)
+            engine = create_engine(uri, **kwargs)
+            _engines.set(key, engine)
+    return engine
+
+
+def one_shot_engine(uri: str, connect_timeout: int = 5) -> Engine:
+    """
+    Unpooled engine for one-off probes (connection test, schema listing).
+    Callers must dispose() it when done.
+    """
+    connect_args = {} if uri.startswith("sqlite") else {"connect_timeout": connect_timeout}
+    return create_engine(uri, poolclass=NullPool, connect_args=connect_args)
@@ -1,3 +1,7 @@
+import hashlib
+import logging
+import threading
+from functools import lru_cache
 from typing import Literal, Optional
 from llama_index.llms.openai import OpenAI
 from llama_index.llms.anthropic import Anthropic
@@ -5,92 +9,179 @@ from llama_index.core.llms import LLM
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.embeddings import BaseEmbedding
 
+from app.core.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# FEB 2026 Retirement Mapping: Mapping dead models to active ones
+GEMINI_MODEL_MAP = {
+    "gemini-1.5-flash": "gemini-1.5-flash",
+    "gemini-1.5-pro": "gemini-1.5-pro",
+    "gemini-2.0-flash": "gemini-2.0-flash",
+    "gemini-2.0-pro": "gemini-2.0-pro-exp-0205",
+}
+
+# Texts per embedding request. Cloud APIs take large batches in one HTTP call;
+# local models are bounded by (GPU) memory.
+CLOUD_EMBED_BATCH_SIZE = 100
+LOCAL_EMBED_BATCH_SIZE_GPU = 32
+LOCAL_EMBED_BATCH_SIZE_CPU = 16
+
+# Model instances shared by tenants with the same provider/key/model: one HTTP client
+# pool per credential instead of one per pipeline. Keyed by digest so plaintext API
+# keys aren't used as keys (as for the engine cache in app.core.db).
+MODEL_CACHE_SIZE = 32
+_llms = LRUCache(maxsize=MODEL_CACHE_SIZE)
+_cloud_embed_models = LRUCache(maxsize=MODEL_CACHE_SIZE)
+
+def _model_key(*parts: Optional[str]) -> bytes:
+    return hashlib.sha256("\0".join(p or "" for p in parts).encode()).digest()
+
+# Optional provider SDKs are imported lazily, once per process
+@lru_cache(maxsize=None)
+def _groq_cls():
+    from llama_index.llms.groq import Groq
+    return Groq
+
+@lru_cache(maxsize=None)
+def _gemini_cls():
+    from llama_index.llms.google_genai import GoogleGenAI
+    return GoogleGenAI
+
+@lru_cache(maxsize=None)
+def _ollama_cls():
+    from llama_index.llms.ollama import Ollama
+    return Ollama
+
+def _make_openai(api_key: str, model_name: Optional[str]) -> LLM:
+    return OpenAI(
+        model=model_name or "gpt-4o",
+        api_key=api_key,
+        max_tokens=4096
+    )
+
+def _make_anthropic(api_key: str, model_name: Optional[str]) -> LLM:
+    return Anthropic(
+        model=model_name or "claude-3-5-sonnet-20240620",
+        api_key=api_key
+    )
+
+def _make_groq(api_key: str, model_name: Optional[str]) -> LLM:
+    # 8b-instant has much higher TPM limits on free tier than 70b
+    return _groq_cls()(
+        model=model_name or "llama-3.1-8b-instant",
+        api_key=api_key,
+        max_tokens=2048
+    )
+
+def _make_gemini(api_key: str, model_name: Optional[str]) -> LLM:
+    requested = model_name or "gemini-1.5-flash"
+    # Clean possible models/ prefix for mapping
+    clean_name = requested.replace("models/", "")
+    
+    target_model = GEMINI_MODEL_MAP.get(clean_name, clean_name)
+    
+    if not target_model.startswith("models/"):
+        target_model = f"models/{target_model}"
+    
+    logger.debug("Gemini model mapping: %s -> %s", requested, target_model)
+    return _gemini_cls()(
+        model=target_model,
+        api_key=api_key,
+        transport="rest",
+        max_tokens=8192,
+    )
+
+def _make_ollama(api_key: str, model_name: Optional[str]) -> LLM:
+    # base_url is usually http://localhost:11434
+    # In this case api_key can be used as the base_url
+    url = api_key if api_key.startswith('http') else "http://localhost:11434"
+    return _ollama_cls()(
+        model=model_name or "llama3",
+        base_url=url,
+        request_timeout=60.0
+    )
+
+_LLM_PROVIDERS = {
+    "openai": _make_openai,
+    "anthropic": _make_anthropic,
+    "groq": _make_groq,
+    "gemini": _make_gemini,
+    "ollama": _make_ollama,
+}
+
 class LLMFactory:
     @staticmethod
     def create_llm(provider: str, api_key: str, model_name: Optional[str] = None) -> LLM:
-        print(f"[DEBUG] Factory creating LLM: {provider} - Model: {model_name}")
         """
         Instantiates a LlamaIndex LLM object based on tenant configuration.
         """
-        if provider == "openai":
-            return OpenAI(
-                model=model_name or "gpt-4o",
-                api_key=api_key,
-                max_tokens=4096
-            )
-        elif provider == "anthropic":
-            return Anthropic(
-                model=model_name or "claude-3-5-sonnet-20240620",
-                api_key=api_key
-            )
-        elif provider == "groq":
-            from llama_index.llms.groq import Groq
-            # 8b-instant has much higher TPM limits on free tier than 70b
-            return Groq(
-                model=model_name or "llama-3.1-8b-instant",
-                api_key=api_key,
-                max_tokens=2048
-            )
-        elif provider == "gemini":
-            from llama_index.llms.google_genai import GoogleGenAI
-            
-            # FEB 2026 Retirement Mapping: Mapping dead models to active ones
-            model_map = {
-                "gemini-1.5-flash": "gemini-1.5-flash",
-                "gemini-1.5-pro": "gemini-1.5-pro",
-                "gemini-2.0-flash": "gemini-2.0-flash",
-                "gemini-2.0-pro": "gemini-2.0-pro-exp-0205",
-            }
-            
-            requested = model_name or "gemini-1.5-flash"
-            # Clean possible models/ prefix for mapping
-            clean_name = requested.replace("models/", "")
-            
-            target_model = model_map.get(clean_name, clean_name)
-            
-            if not target_model.startswith("models/"):
-                target_model = f"models/{target_model}"
-            
-            print(f"[DEBUG] Gemini model mapping: {requested} -> {target_model}")
-            return GoogleGenAI(
-                model=target_model,
-                api_key=api_key,
-                transport="rest",
-                max_tokens=8192,
-            )
-        elif provider == "ollama":
-            from llama_index.llms.ollama import Ollama
-            # base_url is usually http://localhost:11434
-            # In this case api_key can be used as the base_url
-            url = api_key if api_key.startswith('http') else "http://localhost:11434"
-            return Ollama(
-                model=model_name or "llama3",
-                base_url=url,
-                request_timeout=60.0
-            )
-        else:
+        builder = _LLM_PROVIDERS.get(provider)
+        if builder is None:
             raise ValueError(f"Unsupported LLM provider: {provider}")
+        key = _model_key(provider, api_key, model_name)
+        llm = _llms.get(key)
+        if llm is None:
+            logger.debug("Factory creating LLM: %s - Model: %s", provider, model_name)
+            llm = builder(api_key, model_name)
+            _llms.set(key, llm)
+        return llm
+
+# Set once the local model has loaded. A failure (e.g. model download error) isn't
+# remembered: the next pipeline build tries again
+_local_embed: Optional[BaseEmbedding] = None
+_local_embed_lock = threading.Lock()
+
+def _local_embed_model() -> Optional[BaseEmbedding]:
+    """Local HuggingFace embedding model, loaded once per process (None if unavailable)."""
+    global _local_embed
+    if _local_embed is not None:
+        return _local_embed
+    with _local_embed_lock:
+        if _local_embed is None:
+            try:
+                from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+                import torch
+                batch_size = LOCAL_EMBED_BATCH_SIZE_GPU if torch.cuda.is_available() else LOCAL_EMBED_BATCH_SIZE_CPU
+                # This is fast, local, and perfect for table names/schema
+                _local_embed = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5", embed_batch_size=batch_size)
+            except Exception as e:
+                logger.warning("Local embeddings failed, falling back to cloud: %s", e)
+    return _local_embed
+
+def _make_cloud_embed_model(provider: str, api_key: str) -> Optional[BaseEmbedding]:
+    if provider == "openai":
+        return OpenAIEmbedding(api_key=api_key, embed_batch_size=CLOUD_EMBED_BATCH_SIZE)
+    elif provider == "gemini":
+        from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+        return GoogleGenAIEmbedding(
+            model_name="models/text-embedding-004", 
+            api_key=api_key,
+            embed_batch_size=CLOUD_EMBED_BATCH_SIZE
+        )
+    return None
 
 class EmbedModelFactory:
     @staticmethod
-    def create_embed_model(provider: str, api_key: str) -> BaseEmbedding:
+    def create_embed_model(provider: str, api_key: str, shared: bool = True) -> BaseEmbedding:
         """
         Instantiates a LlamaIndex Embedding model.
         Optimization: We use local embeddings by default for schema reflection 
         to drastically reduce latency and avoid cloud API failures/costs.
+        The local model is shared by all tenants (one copy of the weights).
+        shared=False returns a fresh cloud model: its async HTTP client binds to the
+        first event loop that uses it, so code running its own loop (ingestion)
+        must not touch the process-wide instance used on the app loop.
         """
-        try:
-            from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-            # This is fast, local, and perfect for table names/schema
-            return HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
-        except Exception as e:
-            print(f"[WARN] Local embeddings failed, falling back to cloud: {e}")
-            if provider == "openai":
-                return OpenAIEmbedding(api_key=api_key)
-            elif provider == "gemini":
-                from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-                return GoogleGenAIEmbedding(
-                    model_name="models/text-embedding-004", 
-                    api_key=api_key
-                )
-            return None
+        local = _local_embed_model()
+        if local is not None:
+            return local
+        if not shared:
+            return _make_cloud_embed_model(provider, api_key)
+        key = _model_key(provider, api_key)
+        embed_model = _cloud_embed_models.get(key)
+        if embed_model is None:
+            embed_model = _make_cloud_embed_model(provider, api_key)
+            if embed_model is not None:
+                _cloud_embed_models.set(key, embed_model)
+        return embed_model
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from cryptography.fernet import Fernet
 from app.core.config import settings
 
@@ -9,6 +10,11 @@ def encrypt_key(plain_key: str) -> str:
     """Encrypts a tenant's LLM API key for storage."""
     return _cipher.encrypt(plain_key.encode()).decode()
 
+@lru_cache(maxsize=512)
 def decrypt_key(encrypted_key: str) -> str:
-    """Decrypts the API key for runtime use."""
+    """
+    Decrypts the API key for runtime use.
+    Memoized per ciphertext: a token always decrypts to the same value, and
+    key rotation produces a new ciphertext (hence a new cache entry).
+    """
     return _cipher.decrypt(encrypted_key.encode()).decode()
@@ -1,38 +1,498 @@
 import html
+import logging
 import re
-from typing import List, Optional, Dict, Any
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from itertools import groupby
+from operator import itemgetter
+from contextlib import nullcontext
+from types import MappingProxyType
+from typing import List, Optional, Dict, Any, TypedDict
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# HTML cleanup for description fields (applied to every detail/list row)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+# Word tokens of a free-text term, for tsquery prefix lexemes
+_WORD_RE = re.compile(r'\w+')
+
+# Search term filtering/classification (built once, not per call)
+_TITLE_STOP = frozenset({"il", "lo", "la", "i", "gli", "le", "un", "uno", "una",
+                         "del", "della", "dei", "degli", "delle", "di", "con", "in"})
+_NAME_STOP = frozenset({"di", "da", "del", "de"})
+_GQ_STOP = frozenset({"di", "del", "della", "dei", "degli", "con", "per",
+                      "tra", "fra", "nel", "nella", "uno", "una"})
+_SCULPT_KW = frozenset({"SCULTORE", "SCULTORI", "SCULTURA", "SCULTURE"})
+_PAINT_KW = frozenset({"PITTORE", "PITTORI", "PITTURA", "DIPINTO", "DIPINTI"})
+# list_artisti has its own, narrower sets
+_ARTIST_NAME_STOP = frozenset({"il", "lo", "la", "di", "de", "da"})
+_ARTIST_SCULPT_KW = frozenset({"SCULTORE", "SCULTORI", "SCULTURA"})
+_ARTIST_PAINT_KW = frozenset({"PITTORE", "PITTORI", "PITTURA"})
+
+# Technique synonyms, first match wins: (keywords in the request, ILIKE patterns)
+_TECHNIQUE_SYNONYMS = (
+    (("BRONZ",), ["%BRONZ%"]),
+    (("OLIO", "OIL"), ["%OLIO%", "%OIL%"]),
+    (("GESSO", "PLASTER"), ["%GESS%", "%PLASTER%"]),
+    (("TERRACOTTA",), ["%TERRACOTT%"]),
+    (("MARMO", "MARBLE"), ["%MARMO%", "%MARBLE%"]),
+)
+
+
+def _technique_patterns(technique: str, prefix: bool = False) -> List[str]:
+    """
+    ILIKE patterns for a technique filter: known materials map to their synonyms.
+    With `prefix`, patterns are lower-cased for lower(col) LIKE and free text is anchored.
+    """
+    tech_clean = technique.upper()
+    for keywords, patterns in _TECHNIQUE_SYNONYMS:
+        if any(k in tech_clean for k in keywords):
+            return [p.lower() for p in patterns] if prefix else patterns
+    return [f"{technique.lower()}%"] if prefix else [f"%{technique}%"]
+
+
+def _title_filter(title: str, params: Dict[str, Any]) -> str:
+    """
+    Fuzzy title condition: a title qualifies if it contains any of the terms
+    (each term is one trigram-indexed ILIKE probe). Adds its binds to `params`.
+    """
+    title_terms = [t for t in title.split() if t.casefold() not in _TITLE_STOP and len(t) > 1]
+    if not title_terms:
+        params["title_fallback"] = f"%{title}%"
+        return " AND aw.artistworktitle ILIKE :title_fallback"
+    conditions = []
+    for i, term in enumerate(title_terms):
+        key = f"title_{i}"
+        conditions.append(f"aw.artistworktitle ILIKE :{key}")
+        params[key] = f"%{term}%"
+    return f" AND ({' OR '.join(conditions)})"
+
+
+def _category_synonym(category: str, sculpt_kw: frozenset, paint_kw: frozenset) -> Optional[str]:
+    """Exact artist category a sculpture/painting keyword stands for, if any."""
+    cat_clean = category.upper()
+    if cat_clean in sculpt_kw:
+        return "SCULTORI"
+    if cat_clean in paint_kw:
+        return "PITTORI"
+    return None
+
+
+# list_opere general_query: per-term text match (full-text or ILIKE) ...
+_GQ_TEXT_FTS = (
+    "aw.search_tsv @@ to_tsquery('simple', :{key}_q)"
+    " OR a.search_tsv @@ to_tsquery('simple', :{key}_q)"
+)
+_GQ_TEXT_ILIKE = (
+    "aw.artistworktitle ILIKE :{key}"
+    " OR aw.artistworkdescription ILIKE :{key}"
+    " OR a.artistname ILIKE :{key}"
+    " OR a.biography ILIKE :{key}"
+)
+# ... combined with the lookup columns; sculpture/painting terms also match the category
+_GQ_SCULTORI_FMT = (
+    " AND ({text}"
+    " OR t.techniquedescription ILIKE :{key}"
+    " OR ac.artistcategorydescription ILIKE :{key}"
+    " OR ac.artistcategorydescription = 'SCULTORI')"
+)
+_GQ_PITTORI_FMT = (
+    " AND ({text}"
+    " OR t.techniquedescription ILIKE :{key}"
+    " OR ac.artistcategorydescription ILIKE :{key}"
+    " OR ac.artistcategorydescription = 'PITTORI')"
+)
+_GQ_DEFAULT_FMT = (
+    " AND ({text}"
+    " OR t.techniquedescription ILIKE :{key}"
+    " OR r.roomname ILIKE :{key}"
+    " OR ac.artistcategorydescription ILIKE :{key})"
+)
+
+
+# Row shapes returned by the list lookups. Plain dicts at runtime (the tools
+# json.dumps them as they are); the TypedDicts only document the keys.
+class OperaRow(TypedDict):
+    artistworkid: int
+    artistworktitle: str
+    artistname: Optional[str]
+    artistcategorydescription: Optional[str]
+    roomname: Optional[str]
+    techniquedescription: Optional[str]
+
+
+class InventoryRow(TypedDict):
+    artistworkid: int
+    artistworktitle: str
+    artistname: Optional[str]
+    roomname: Optional[str]
+
+
+class ArtworkRef(TypedDict):
+    artistworkid: int
+    artistworktitle: str
+    artistname: Optional[str]
+
+
+class PercorsoOperaRow(ArtworkRef):
+    sortingsequence: Optional[int]
+
+
+class ArtistaRow(TypedDict):
+    artistid: int
+    artistname: str
+    category: Optional[str]
+
+
+class LocationRow(TypedDict):
+    locationid: int
+    locationname: Optional[str]
+    roomname: Optional[str]
+
+
+class PathwayRow(TypedDict):
+    pathwayid: int
+    pathwayname: str
+    pathwaydescription: Optional[str]
+
+
+def _dicts(result) -> List[Dict[str, Any]]:
+    """Rows as plain dicts, zipped from the column names fetched once per result."""
+    keys = tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result.all()]
+
+
+# Reference data (categories, techniques, locations, pathways, museum info)
+# changes rarely but is read on almost every conversation. Curator edits can be
+# pushed at once through POST /tenants/{id}/cache/invalidate.
+REFERENCE_CACHE_SIZE = 64
+REFERENCE_CACHE_TTL = 600
+
+# Lookup filters that can switch from substring to prefix matching (see MuseumBroker)
+PREFIX_MATCH_FILTERS = frozenset({"room_name", "artist_category", "technique"})
+
+# Fixed-shape statements, formatted with the schema and wrapped in text() once per
+# broker (see MuseumBroker.__init__) instead of being rebuilt on every call.
+_QUERIES = {
+    "search_by_inventory": """
+        SELECT aw.artistworkid, aw.artistworktitle, a.artistname, r.roomname
+        FROM {schema}.artistwork aw
+        LEFT JOIN {schema}.artist a ON aw.artistid = a.artistid
+        LEFT JOIN {schema}.room r ON aw.roomid = r.roomid
+        WHERE aw.siteid = :site_id AND aw.inventorynumber = :inv
+    """,
+    "list_locations": """
+        SELECT DISTINCT loc.locationid, loc.locationname, r.roomname
+        FROM {schema}.location loc
+        LEFT JOIN {schema}.room r ON loc.roomid = r.roomid
+        WHERE loc.siteid = :site_id
+    """,
+    "get_location_details": """
+        SELECT ld.locationname, ld.locationdescription as description
+        FROM {schema}.locationdescription ld
+        WHERE ld.locationid = :id AND ld.languageid = :lang
+    """,
+    "get_percorso_opere": """
+        SELECT aw.artistworkid, aw.artistworktitle, a.artistname, ps.sortingsequence
+        FROM {schema}.pathway p
+        JOIN {schema}.pathwayspot ps ON p.pathwayid = ps.pathwayid
+        JOIN {schema}.artistwork aw ON ps.artistworkid = aw.artistworkid
+        LEFT JOIN {schema}.artist a ON aw.artistid = a.artistid
+        WHERE p.pathwayname ILIKE :name AND aw.siteid = :site_id
+        ORDER BY ps.sortingsequence
+    """,
+    "list_pathways": """
+        SELECT pathwayid, pathwayname, pathwaydescription
+        FROM {schema}.pathway
+        WHERE siteid = :site_id
+    """,
+    "get_pathway_details": """
+        SELECT pathwayname, pathwaydescription as description
+        FROM {schema}.pathwaydescription
+        WHERE pathwayid = :id AND languageid = :lang
+    """,
+    "list_categories": """
+        SELECT DISTINCT ac.artistcategorydescription
+        FROM {schema}.artistcategory ac
+        JOIN {schema}.artist a ON ac.artistcategoryid = a.artistcategoryid
+        WHERE a.siteid = :site_id
+    """,
+    "list_techniques": """
+        SELECT DISTINCT t.techniquedescription
+        FROM {schema}.technique t
+        JOIN {schema}.artistwork aw ON t.techniqueid = aw.techniqueid
+        WHERE aw.siteid = :site_id
+        ORDER BY t.techniquedescription
+    """,
+    "get_museum_info": """
+        SELECT sitename, sitedescription, history, architecture,
+               address, city, country, telephone, email
+        FROM {schema}.site
+        WHERE siteid = :site_id
+    """,
+    "list_artworks_in_room": """
+        SELECT aw.artistworkid, aw.artistworktitle, a.artistname
+        FROM {schema}.artistwork aw
+        LEFT JOIN {schema}.artist a ON aw.artistid = a.artistid
+        WHERE aw.siteid = :site_id AND aw.roomid = :room_id
+        LIMIT 5
+    """,
+    "list_artworks_in_rooms": """
+        SELECT roomid, artistworkid, artistworktitle, artistname
+        FROM (
+            SELECT aw.roomid, aw.artistworkid, aw.artistworktitle, a.artistname,
+                   ROW_NUMBER() OVER (PARTITION BY aw.roomid ORDER BY aw.artistworkid) as rn
+            FROM {schema}.artistwork aw
+            LEFT JOIN {schema}.artist a ON aw.artistid = a.artistid
+            WHERE aw.siteid = :site_id AND aw.roomid = ANY(:room_ids)
+        ) ranked
+        WHERE rn <= 5
+        ORDER BY roomid, artistworkid
+    """,
+}
+
+
+# Shared SELECT/FROM of the filtered listings; WHERE clauses are appended per call
+_BASE_QUERIES = {
+    "list_opere": """
+        SELECT aw.artistworkid, aw.artistworktitle, a.artistname,
+               ac.artistcategorydescription, r.roomname, t.techniquedescription
+        FROM {schema}.artistwork aw
+        LEFT JOIN {schema}.artist a ON aw.artistid = a.artistid
+        LEFT JOIN {schema}.artistcategory ac ON a.artistcategoryid = ac.artistcategoryid
+        LEFT JOIN {schema}.room r ON aw.roomid = r.roomid
+        LEFT JOIN {schema}.technique t ON aw.techniqueid = t.techniqueid
+        WHERE aw.siteid = :site_id
+    """,
+    "find_opere_by_title": """
+        SELECT aw.artistworkid, aw.artistworktitle, a.artistname
+        FROM {schema}.artistwork aw
+        LEFT JOIN {schema}.artist a ON aw.artistid = a.artistid
+        WHERE aw.siteid = :site_id AND aw.artistworktitle NOT ILIKE '%Sensoriale%'
+    """,
+    "list_artisti": """
+        SELECT a.artistid, a.artistname, ac.artistcategorydescription as category
+        FROM {schema}.artist a
+        LEFT JOIN {schema}.artistcategory ac ON a.artistcategoryid = ac.artistcategoryid
+        WHERE a.siteid = :site_id
+    """,
+}
+
+# Opera details in one round-trip: the target description, the localized/Italian
+# artistworklang rows and the nearby artworks are resolved as LATERAL subqueries;
+# MuseumBroker._opera_details_from_row only picks among them.
+_OPERA_DETAILS_QUERY = """
+        SELECT aw.artistworkid, aw.artistworktitle as original_title,
+               r.roomname, a.artistname, t.techniquedescription,
+               aw.realizationyear, aw.inventorynumber, aw.roomid, aw.imageref,
+               tgt.found as has_target, tgt.description as target_description,
+               loc.found as has_lang, loc.artistworktitle as lang_title,
+               loc.description as lang_description,
+               it.found as has_it, it.artistworktitle as it_title,
+               it.description as it_description,
+               nearby.titles as nearby_titles
+        FROM {schema}.artistwork aw
+        LEFT JOIN {schema}.room r ON aw.roomid = r.roomid
+        LEFT JOIN {schema}.artist a ON aw.artistid = a.artistid
+        LEFT JOIN {schema}.technique t ON aw.techniqueid = t.techniqueid
+        LEFT JOIN LATERAL (
+            SELECT true as found, atd.artistworktargetdescription as description
+            FROM {schema}.artistworkaudiencetargetdesc atd
+            WHERE atd.artistworkid = aw.artistworkid
+              AND atd.languageid = :lang AND atd.audiencetargetid = :target
+            LIMIT 1
+        ) tgt ON true
+        LEFT JOIN LATERAL (
+            SELECT true as found, awl.artistworktitle, awl.artistworkdescription as description
+            FROM {schema}.artistworklang awl
+            WHERE awl.artistworkid = aw.artistworkid AND awl.languageid = :lang
+            LIMIT 1
+        ) loc ON true
+        LEFT JOIN LATERAL (
+            SELECT true as found, awl.artistworktitle, awl.artistworkdescription as description
+            FROM {schema}.artistworklang awl
+            WHERE awl.artistworkid = aw.artistworkid AND awl.languageid = 'it'
+            LIMIT 1
+        ) it ON true
+        LEFT JOIN LATERAL (
+            SELECT array_agg(n.artistworktitle) FILTER (WHERE n.artistworkid <> aw.artistworkid) as titles
+            FROM (
+                SELECT artistworkid, artistworktitle
+                FROM {schema}.artistwork
+                WHERE siteid = :site_id AND roomid = aw.roomid
+                LIMIT 5
+            ) n
+        ) nearby ON true
+        WHERE {where}
+    """
+
+
+# Artist details: localized and Italian descriptions as LATERAL subqueries.
+# {works_column}/{works_join} optionally add the artist's artworks as one JSON
+# array, so the details tool needs a single round-trip.
+_ARTISTA_DETAILS_QUERY = """
+        SELECT a.artistid, a.artistname, a.birthplace, a.deathplace,
+               a.birthdate, a.deathdate, a.biography,
+               ac.artistcategorydescription as category,
+               loc.artistdescription as loc_description,
+               loc.birthdeathdescription as loc_birthdeath,
+               it.found as has_it,
+               it.artistdescription as it_description,
+               it.birthdeathdescription as it_birthdeath{works_column}
+        FROM {schema}.artist a
+        LEFT JOIN {schema}.artistcategory ac ON a.artistcategoryid = ac.artistcategoryid
+        LEFT JOIN LATERAL (
+            SELECT artistdescription, birthdeathdescription
+            FROM {schema}.artistdescription
+            WHERE artistid = a.artistid AND languageid = :lang
+            LIMIT 1
+        ) loc ON true
+        LEFT JOIN LATERAL (
+            SELECT true as found, artistdescription, birthdeathdescription
+            FROM {schema}.artistdescription
+            WHERE artistid = a.artistid AND languageid = 'it'
+            LIMIT 1
+        ) it ON true{works_join}
+        WHERE a.artistid = :id
+    """
+
+# Same selection as list_opere(artist_name=...): no Sensoriale copies, by title, max 50
+_ARTISTA_WORKS_JOIN = """
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'titolo', w.artistworktitle, 'tecnica', w.techniquedescription, 'sala', w.roomname
+                   ) ORDER BY w.artistworktitle) as opere
+            FROM (
+                SELECT aw.artistworktitle, t.techniquedescription, r.roomname
+                FROM {schema}.artistwork aw
+                LEFT JOIN {schema}.room r ON aw.roomid = r.roomid
+                LEFT JOIN {schema}.technique t ON aw.techniqueid = t.techniqueid
+                WHERE aw.artistid = a.artistid AND aw.siteid = :site_id
+                  AND aw.artistworktitle NOT ILIKE '%Sensoriale%'
+                ORDER BY aw.artistworktitle
+                LIMIT 50
+            ) w
+        ) works ON true"""
 
 
 class MuseumBroker:
     """
     Business Logic Layer that abstracts database access.
     Implements the logic defined in the SpringBoot REST API (Swagger).
+    Substring filters (ILIKE '%term%') rely on the pg_trgm GIN indexes
+    created by scripts/create_search_indexes.py.
+
+    `prefix_match` names lookup filters (of PREFIX_MATCH_FILTERS) that match
+    the start of the column instead of any substring: lower(col) LIKE 'term%'
+    is served by the text_pattern_ops B-tree indexes from the same script.
+    The query pipelines pass settings.BROKER_PREFIX_MATCH (empty by default).
     """
-    def __init__(self, engine: Engine, schema: str = "guide"):
+    def __init__(self, engine: Engine, schema: str = "guide", prefix_match=()):
         self.engine = engine
         self.schema = schema
+        unknown = set(prefix_match) - PREFIX_MATCH_FILTERS
+        if unknown:
+            raise ValueError(f"Unsupported prefix_match filters: {sorted(unknown)}")
+        self.prefix_match = frozenset(prefix_match)
         self.category_map = {
             "it": {"SCULTORI": "Scultori", "PITTORI": "Pittori", "DIRETTORI": "Direttori"},
             "en": {"SCULTORI": "Sculptors", "PITTORI": "Painters", "DIRETTORI": "Directors"},
             "fr": {"SCULTORI": "Sculpteurs", "PITTORI": "Peintres", "DIRETTORI": "Directeurs"},
             "es": {"SCULTORI": "Escultores", "PITTORI": "Pintores", "DIRETTORI": "Directores"}
         }
+        # Flat (lang, CATEGORY) -> label view of category_map: one probe per row
+        self._cat_flat = {
+            (lang, key): label
+            for lang, labels in self.category_map.items()
+            for key, label in labels.items()
+        }
+        self._cat_langs = frozenset(self.category_map)
+        # Schema is fixed for the broker's lifetime: interpolate it exactly once
+        self._stmts = {name: text(sql.format(schema=schema)) for name, sql in _QUERIES.items()}
+        self._stmts["get_opera_details"] = text(
+            _OPERA_DETAILS_QUERY.format(schema=schema, where="aw.artistworkid = :id"))
+        self._stmts["get_opera_details_many"] = text(
+            _OPERA_DETAILS_QUERY.format(schema=schema, where="aw.artistworkid = ANY(:ids) AND aw.siteid = :site_id"))
+        self._stmts["get_artista_details"] = text(
+            _ARTISTA_DETAILS_QUERY.format(schema=schema, works_column="", works_join=""))
+        self._stmts["get_artista_details_with_opere"] = text(_ARTISTA_DETAILS_QUERY.format(
+            schema=schema, works_column=",\n               works.opere",
+            works_join=_ARTISTA_WORKS_JOIN.format(schema=schema)))
+        self._base_sql = {name: sql.format(schema=schema) for name, sql in _BASE_QUERIES.items()}
+        # search_tsv columns come from scripts/create_search_indexes.py; ILIKE without them
+        self._has_fts = self._detect_search_tsv()
+        # Schema of the pg_trgm extension (similarity() ranking), None if not installed
+        self._trgm_schema = self._detect_trgm()
+        # (method, site_id) -> result of the reference-data lookups
+        self._reference_cache = TTLCache(maxsize=REFERENCE_CACHE_SIZE, ttl=REFERENCE_CACHE_TTL)
+
+    def invalidate_reference_cache(self) -> None:
+        """Drop cached reference data (call after editing the museum catalogue)."""
+        self._reference_cache.clear()
+
+    def _detect_search_tsv(self) -> bool:
+        query = text("""
+            SELECT count(*) FROM information_schema.columns
+            WHERE table_schema = :schema AND column_name = 'search_tsv'
+              AND table_name IN ('artistwork', 'artist')
+        """)
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(query, {"schema": self.schema}).scalar() == 2
+        except Exception as e:
+            logger.warning("Full-text search columns check failed: %s", e)
+            return False
+
+    def _detect_trgm(self) -> Optional[str]:
+        # Tenant connections may pin search_path to the guide schema: keep the
+        # extension's own schema to qualify its functions
+        query = text("""
+            SELECT n.nspname FROM pg_extension e
+            JOIN pg_namespace n ON n.oid = e.extnamespace
+            WHERE e.extname = 'pg_trgm'
+        """)
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(query).scalar()
+        except Exception as e:
+            logger.warning("pg_trgm extension check failed: %s", e)
+            return None
+
+    def connect(self) -> Connection:
+        """
+        Connection to share across several broker calls (pass it as `conn=`):
+        one pool checkout for a chain of lookups instead of one per call.
+        """
+        return self.engine.connect()
+
+    def _connect(self, conn: Optional[Connection]):
+        # Caller-owned connection: reuse it and leave closing to the caller
+        return nullcontext(conn) if conn is not None else self.engine.connect()
+
+    def _text_match(self, filter_name: str, column: str, rhs: str) -> str:
+        if filter_name in self.prefix_match:
+            return f"lower({column}) LIKE {rhs}"
+        return f"{column} ILIKE {rhs}"
+
+    def _match_pattern(self, filter_name: str, term: str) -> str:
+        if filter_name in self.prefix_match:
+            return f"{term.lower()}%"
+        return f"%{term}%"
 
     def _localize_category(self, category: Optional[str], lang: str) -> str:
         if not category:
             return ""
-        upper_cat = category.upper()
-        return self.category_map.get(lang, self.category_map["it"]).get(upper_cat, category)
+        if lang not in self._cat_langs:
+            lang = "it"
+        return self._cat_flat.get((lang, category.upper()), category)
 
     def _strip_html(self, text_str: Optional[str]) -> str:
         if not text_str:
             return ""
-        text_str = html.unescape(text_str)
-        text_str = re.sub(r'<[^>]+>', ' ', text_str)
-        text_str = re.sub(r'\s+', ' ', text_str).strip()
-        return text_str
+        return _WS_RE.sub(' ', _TAG_RE.sub(' ', html.unescape(text_str))).strip()
 
     # ------------------------------------------------------------------
     # OPERE
@@ -48,153 +508,105 @@ class MuseumBroker:
         technique: Optional[str] = None,
         general_query: Optional[str] = None,
         include_sensoriale: bool = False,
-    ) -> List[Dict[str, Any]]:
+        conn: Optional[Connection] = None,
+    ) -> List[OperaRow]:
         """Lista opere con filtri. Esclude versioni Sensoriale per default."""
-        query = f"""
-            SELECT aw.artistworkid, aw.artistworktitle, a.artistname,
-                   ac.artistcategorydescription, r.roomname, t.techniquedescription
-            FROM {self.schema}.artistwork aw
-            LEFT JOIN {self.schema}.artist a ON aw.artistid = a.artistid
-            LEFT JOIN {self.schema}.artistcategory ac ON a.artistcategoryid = ac.artistcategoryid
-            LEFT JOIN {self.schema}.room r ON aw.roomid = r.roomid
-            LEFT JOIN {self.schema}.technique t ON aw.techniqueid = t.techniqueid
-            WHERE aw.siteid = :site_id
-        """
+        # SQL fragments are collected and joined once at the end
+        parts = [self._base_sql["list_opere"]]
         params: Dict[str, Any] = {"site_id": site_id}
 
         # Exclude "Sensoriale" reproductions unless explicitly requested
         if not include_sensoriale:
-            query += " AND aw.artistworktitle NOT ILIKE '%Sensoriale%'"
+            parts.append(" AND aw.artistworktitle NOT ILIKE '%Sensoriale%'")
 
         if title:
-            stop_titles = {"il", "lo", "la", "i", "gli", "le", "un", "uno", "una",
-                           "del", "della", "dei", "degli", "delle", "di", "con", "in"}
-            title_terms = [t for t in title.split() if t.lower() not in stop_titles and len(t) > 1]
-            if title_terms:
-                # Try strict match first
-                strict_conditions = []
-                for i, term in enumerate(title_terms):
-                    key = f"title_s_{i}"
-                    strict_conditions.append(f"aw.artistworktitle ILIKE :{key}")
-                    params[key] = f"%{term}%"
-                
-                # We add a 'relevance' score based on how many terms match
-                # This is a DIY fuzzy search using weighted OR if AND fails
-                or_conditions = []
-                for i, term in enumerate(title_terms):
-                    key = f"title_o_{i}"
-                    or_conditions.append(f"CASE WHEN aw.artistworktitle ILIKE :{key} THEN 1 ELSE 0 END")
-                    params[key] = f"%{term}%"
-                
-                relevance_sql = " + ".join(or_conditions)
-                query += f" AND ({' AND '.join(strict_conditions)} OR ({relevance_sql}) > 0)"
-                # We'll use this relevance in ORDER BY later if we want
-            else:
-                query += " AND aw.artistworktitle ILIKE :title_fallback"
-                params["title_fallback"] = f"%{title}%"
+            parts.append(_title_filter(title, params))
 
         if artist_name:
             name_terms = [t for t in artist_name.split()
-                          if t.lower() not in {"di", "da", "del", "de"} and len(t) > 2]
+                          if t.casefold() not in _NAME_STOP and len(t) > 2]
             if name_terms:
                 conditions = []
                 for i, term in enumerate(name_terms):
                     key = f"art_n_{i}"
                     conditions.append(f"a.artistname ILIKE :{key}")
                     params[key] = f"%{term}%"
-                query += f" AND ({' OR '.join(conditions)})"
+                parts.append(f" AND ({' OR '.join(conditions)})")
             else:
-                query += " AND a.artistname ILIKE :art_fallback"
+                parts.append(" AND a.artistname ILIKE :art_fallback")
                 params["art_fallback"] = f"%{artist_name}%"
 
         if artist_category:
-            cat_clean = artist_category.upper()
-            if cat_clean in ["SCULTORE", "SCULTORI", "SCULTURA", "SCULTURE"]:
-                query += " AND (ac.artistcategorydescription ILIKE :artist_category OR ac.artistcategorydescription = 'SCULTORI')"
-            elif cat_clean in ["PITTORE", "PITTORI", "PITTURA", "DIPINTO", "DIPINTI"]:
-                query += " AND (ac.artistcategorydescription ILIKE :artist_category OR ac.artistcategorydescription = 'PITTORI')"
-            else:
-                query += " AND ac.artistcategorydescription ILIKE :artist_category"
-            params["artist_category"] = f"%{artist_category}%"
+            # Same SQL for every category: the synonym resolves to a bind (NULL = no exact match)
+            cat_match = self._text_match("artist_category", "ac.artistcategorydescription", ":artist_category")
+            parts.append(f" AND ({cat_match} OR ac.artistcategorydescription = :artist_category_eq)")
+            params["artist_category"] = self._match_pattern("artist_category", artist_category)
+            params["artist_category_eq"] = _category_synonym(artist_category, _SCULPT_KW, _PAINT_KW)
 
         if room_name:
-            query += " AND r.roomname ILIKE :room_name"
-            params["room_name"] = f"%{room_name}%"
+            parts.append(f" AND {self._text_match('room_name', 'r.roomname', ':room_name')}")
+            params["room_name"] = self._match_pattern("room_name", room_name)
 
         if technique:
-            tech_clean = technique.upper()
             # STRICT: filter ONLY via technique table — never via free-text description
-            if "BRONZ" in tech_clean:
-                query += " AND t.techniquedescription ILIKE '%BRONZ%'"
-            elif "OLIO" in tech_clean or "OIL" in tech_clean:
-                query += " AND (t.techniquedescription ILIKE '%OLIO%' OR t.techniquedescription ILIKE '%OIL%')"
-            elif "GESSO" in tech_clean or "PLASTER" in tech_clean:
-                query += " AND (t.techniquedescription ILIKE '%GESS%' OR t.techniquedescription ILIKE '%PLASTER%')"
-            elif "TERRACOTTA" in tech_clean:
-                query += " AND t.techniquedescription ILIKE '%TERRACOTT%'"
-            elif "MARMO" in tech_clean or "MARBLE" in tech_clean:
-                query += " AND (t.techniquedescription ILIKE '%MARMO%' OR t.techniquedescription ILIKE '%MARBLE%')"
-            else:
-                query += " AND t.techniquedescription ILIKE :technique"
-            params["technique"] = f"%{technique}%"
+            tech_match = self._text_match("technique", "t.techniquedescription", "ANY(:technique_patterns)")
+            parts.append(f" AND {tech_match}")
+            params["technique_patterns"] = _technique_patterns(technique, "technique" in self.prefix_match)
 
         if general_query:
-            stop_words = {"di", "del", "della", "dei", "degli", "con", "per",
-                          "tra", "fra", "nel", "nella", "uno", "una"}
-            terms = [t for t in general_query.split() if len(t) > 2 and t.lower() not in stop_words]
+            terms = [t for t in general_query.split() if len(t) > 2 and t.casefold() not in _GQ_STOP]
             for i, term in enumerate(terms):
                 key = f"gq_{i}"
                 t_up = term.upper()
-                if t_up in ["SCULTURA", "SCULTURE", "SCULTORE", "SCULTORI"]:
-                    query += (
-                        f" AND (aw.artistworktitle ILIKE :{key}"
-                        f" OR aw.artistworkdescription ILIKE :{key}"
-                        f" OR a.artistname ILIKE :{key}"
-                        f" OR a.biography ILIKE :{key}"
-                        f" OR t.techniquedescription ILIKE :{key}"
-                        f" OR ac.artistcategorydescription ILIKE :{key}"
-                        f" OR ac.artistcategorydescription = 'SCULTORI')"
-                    )
-                elif t_up in ["DIPINTO", "DIPINTI", "PITTORE", "PITTORI", "PITTURA"]:
-                    query += (
-                        f" AND (aw.artistworktitle ILIKE :{key}"
-                        f" OR aw.artistworkdescription ILIKE :{key}"
-                        f" OR a.artistname ILIKE :{key}"
-                        f" OR a.biography ILIKE :{key}"
-                        f" OR t.techniquedescription ILIKE :{key}"
-                        f" OR ac.artistcategorydescription ILIKE :{key}"
-                        f" OR ac.artistcategorydescription = 'PITTORI')"
-                    )
+                # Elisions ("l'amore") leave 1-char tokens: keep only real words
+                words = [w for w in _WORD_RE.findall(term.lower()) if len(w) > 1]
+                if self._has_fts and words:
+                    # Long text columns (title/description, name/biography) through
+                    # the GIN-indexed search_tsv columns, as prefix matches
+                    text_fmt = _GQ_TEXT_FTS
+                    params[f"{key}_q"] = " & ".join(f"{w}:*" for w in words)
                 else:
-                    query += (
-                        f" AND (aw.artistworktitle ILIKE :{key}"
-                        f" OR aw.artistworkdescription ILIKE :{key}"
-                        f" OR a.artistname ILIKE :{key}"
-                        f" OR a.biography ILIKE :{key}"
-                        f" OR t.techniquedescription ILIKE :{key}"
-                        f" OR r.roomname ILIKE :{key}"
-                        f" OR ac.artistcategorydescription ILIKE :{key})"
-                    )
+                    text_fmt = _GQ_TEXT_ILIKE
+                # Short lookup columns keep the substring match
+                if t_up in _SCULPT_KW:
+                    term_fmt = _GQ_SCULTORI_FMT
+                elif t_up in _PAINT_KW:
+                    term_fmt = _GQ_PITTORI_FMT
+                else:
+                    term_fmt = _GQ_DEFAULT_FMT
+                parts.append(term_fmt.format(text=text_fmt.format(key=key), key=key))
                 params[key] = f"%{term}%"
 
-        query += " ORDER BY aw.artistworktitle LIMIT 50"
+        parts.append(" ORDER BY aw.artistworktitle LIMIT 50")
+        query = "".join(parts)
 
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), params)
-            return [dict(row._mapping) for row in result]
+        with self._connect(conn) as conn:
+            rows = _dicts(conn.execute(text(query), params))
+        return rows
 
-    def search_by_inventory(self, site_id: int, inventory_number: str) -> List[Dict[str, Any]]:
-        """Ricerca un'opera tramite numero di inventario."""
-        query = f"""
-            SELECT aw.artistworkid, aw.artistworktitle, a.artistname, r.roomname
-            FROM {self.schema}.artistwork aw
-            LEFT JOIN {self.schema}.artist a ON aw.artistid = a.artistid
-            LEFT JOIN {self.schema}.room r ON aw.roomid = r.roomid
-            WHERE aw.siteid = :site_id AND aw.inventorynumber = :inv
+    def find_opere_by_title(self, site_id: int, title: str, limit: int = 5,
+                            conn: Optional[Connection] = None) -> List[ArtworkRef]:
         """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"site_id": site_id, "inv": inventory_number})
-            return [dict(row._mapping) for row in result]
+        Best `limit` title matches (same filter as list_opere), closest first:
+        ranked by trigram similarity in SQL when pg_trgm is installed, by title otherwise.
+        """
+        params: Dict[str, Any] = {"site_id": site_id, "limit": limit}
+        parts = [self._base_sql["find_opere_by_title"], _title_filter(title, params)]
+        if self._trgm_schema:
+            parts.append(f" ORDER BY {self._trgm_schema}.similarity(aw.artistworktitle, :title_q) DESC, aw.artistworktitle")
+            params["title_q"] = title
+        else:
+            parts.append(" ORDER BY aw.artistworktitle")
+        parts.append(" LIMIT :limit")
+
+        with self._connect(conn) as conn:
+            return _dicts(conn.execute(text("".join(parts)), params))
+
+    def search_by_inventory(self, site_id: int, inventory_number: str, conn: Optional[Connection] = None) -> List[InventoryRow]:
+        """Ricerca un'opera tramite numero di inventario."""
+        with self._connect(conn) as conn:
+            rows = _dicts(conn.execute(self._stmts["search_by_inventory"], {"site_id": site_id, "inv": inventory_number}))
+        return rows
 
     def get_opera_details(
         self,
@@ -202,72 +614,89 @@ class MuseumBroker:
         artist_work_id: int,
         language_id: str = 'it',
         audience_target_id: str = 'STD',
+        conn: Optional[Connection] = None,
     ) -> Dict[str, Any]:
         """Dettaglio opera: descrizione specifica per target/lingua con fallback."""
-        query = f"""
-            SELECT aw.artistworkid, aw.artistworktitle as original_title,
-                   atd.artistworktargetdescription as description,
-                   r.roomname, a.artistname, t.techniquedescription,
-                   aw.realizationyear, aw.inventorynumber, aw.roomid
-            FROM {self.schema}.artistwork aw
-            JOIN {self.schema}.artistworkaudiencetargetdesc atd ON aw.artistworkid = atd.artistworkid
-            LEFT JOIN {self.schema}.room r ON aw.roomid = r.roomid
-            LEFT JOIN {self.schema}.artist a ON aw.artistid = a.artistid
-            LEFT JOIN {self.schema}.technique t ON aw.techniqueid = t.techniqueid
-            WHERE aw.artistworkid = :id
-              AND atd.languageid = :lang
-              AND atd.audiencetargetid = :target
-        """
-        params = {"id": artist_work_id, "lang": language_id, "target": audience_target_id}
+        params = {
+            "id": artist_work_id, "lang": language_id,
+            "target": audience_target_id, "site_id": site_id or 1,
+        }
 
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), params).mappings().first()
-            if result:
-                res_dict = dict(result)
-                res_dict["description"] = self._strip_html(res_dict.get("description"))
-                title_query = (
-                    f"SELECT artistworktitle FROM {self.schema}.artistworklang "
-                    f"WHERE artistworkid = :id AND languageid = :lang"
-                )
-                loc_title = conn.execute(text(title_query), {"id": artist_work_id, "lang": language_id}).scalar()
-                res_dict["artistworktitle"] = loc_title or res_dict["original_title"]
-                res_dict["image_url"] = result.get("imageref")
-                rid = res_dict.get("roomid")
-                if rid:
-                    nearby = self.list_artworks_in_room(site_id or 1, rid)
-                    res_dict["nearby_artworks"] = [
-                        a["artistworktitle"] for a in nearby if a["artistworkid"] != artist_work_id
-                    ]
-                return res_dict
+        with self._connect(conn) as conn:
+            row = conn.execute(self._stmts["get_opera_details"], params).mappings().first()
+        if not row:
+            return {}
+        return self._opera_details_from_row(row, language_id)
 
-            # Fallback 1: artistworklang (specific language)
-            query_fallback = f"""
-                SELECT awl.artistworktitle, awl.artistworkdescription as description,
-                       r.roomname, a.artistname, t.techniquedescription,
-                       aw.realizationyear, aw.inventorynumber, aw.imageref
-                FROM {self.schema}.artistwork aw
-                JOIN {self.schema}.artistworklang awl ON aw.artistworkid = awl.artistworkid
-                LEFT JOIN {self.schema}.room r ON aw.roomid = r.roomid
-                LEFT JOIN {self.schema}.artist a ON aw.artistid = a.artistid
-                LEFT JOIN {self.schema}.technique t ON aw.techniqueid = t.techniqueid
-                WHERE aw.artistworkid = :id AND awl.languageid = :lang
-            """
-            result = conn.execute(text(query_fallback), {"id": artist_work_id, "lang": language_id}).mappings().first()
-            if result and result.get("description"):
-                res_dict = dict(result)
-                res_dict["description"] = self._strip_html(res_dict.get("description"))
-                res_dict["image_url"] = result.get("imageref")
-                return res_dict
-            
-            # Fallback 2: ALWAYS try Italian if description is still missing
-            if language_id != 'it':
-                result = conn.execute(text(query_fallback), {"id": artist_work_id, "lang": 'it'}).mappings().first()
-                if result:
-                    res_dict = dict(result)
-                    res_dict["description"] = self._strip_html(res_dict.get("description"))
-                    res_dict["image_url"] = result.get("imageref")
-                    res_dict["note"] = "Descrizione disponibile solo in italiano."
-                    return res_dict
+    def get_opera_details_many(
+        self,
+        site_id: int,
+        artist_work_ids: List[int],
+        language_id: str = 'it',
+        audience_target_id: str = 'STD',
+        conn: Optional[Connection] = None,
+    ) -> Dict[int, Dict[str, Any]]:
+        """Dettaglio di più opere del sito in un'unica query (artistworkid -> dettaglio)."""
+        if not artist_work_ids:
+            return {}
+        params = {
+            "ids": list(artist_work_ids), "lang": language_id,
+            "target": audience_target_id, "site_id": site_id or 1,
+        }
+
+        with self._connect(conn) as conn:
+            rows = conn.execute(self._stmts["get_opera_details_many"], params).mappings().all()
+        details = {}
+        for row in rows:
+            res = self._opera_details_from_row(row, language_id)
+            if res:
+                details[row["artistworkid"]] = res
+        return details
+
+    def _opera_details_from_row(self, row, language_id: str) -> Dict[str, Any]:
+        common = {
+            "roomname": row["roomname"],
+            "artistname": row["artistname"],
+            "techniquedescription": row["techniquedescription"],
+            "realizationyear": row["realizationyear"],
+            "inventorynumber": row["inventorynumber"],
+        }
+
+        # Primary: description for the requested target/language
+        if row["has_target"]:
+            res_dict = {
+                "artistworkid": row["artistworkid"],
+                "original_title": row["original_title"],
+                "description": self._strip_html(row["target_description"]),
+                **common,
+                "roomid": row["roomid"],
+                "artistworktitle": row["lang_title"] or row["original_title"],
+                "image_url": row["imageref"],
+            }
+            if row["roomid"]:
+                res_dict["nearby_artworks"] = row["nearby_titles"] or []
+            return res_dict
+
+        # Fallback 1: artistworklang (specific language)
+        if row["has_lang"] and row["lang_description"]:
+            return {
+                "artistworktitle": row["lang_title"],
+                "description": self._strip_html(row["lang_description"]),
+                **common,
+                "imageref": row["imageref"],
+                "image_url": row["imageref"],
+            }
+
+        # Fallback 2: ALWAYS try Italian if description is still missing
+        if language_id != 'it' and row["has_it"]:
+            return {
+                "artistworktitle": row["it_title"],
+                "description": self._strip_html(row["it_description"]),
+                **common,
+                "imageref": row["imageref"],
+                "image_url": row["imageref"],
+                "note": "Descrizione disponibile solo in italiano.",
+            }
 
         return {}
 
@@ -281,18 +710,14 @@ class MuseumBroker:
         name: Optional[str] = None,
         category: Optional[str] = None,
         language_id: str = 'it',
-    ) -> List[Dict[str, Any]]:
+        conn: Optional[Connection] = None,
+    ) -> List[ArtistaRow]:
         """Lista artisti con filtri opzionali."""
-        query = f"""
-            SELECT a.artistid, a.artistname, ac.artistcategorydescription as category
-            FROM {self.schema}.artist a
-            LEFT JOIN {self.schema}.artistcategory ac ON a.artistcategoryid = ac.artistcategoryid
-            WHERE a.siteid = :site_id
-        """
+        query = self._base_sql["list_artisti"]
         params: Dict[str, Any] = {"site_id": site_id}
 
         if name:
-            name_terms = [t for t in name.split() if t.lower() not in {"il", "lo", "la", "di", "de", "da"}]
+            name_terms = [t for t in name.split() if t.casefold() not in _ARTIST_NAME_STOP]
             if name_terms:
                 # Use a similarity-like approach: match any term, but prefer those matching more
                 conditions = []
@@ -306,104 +731,99 @@ class MuseumBroker:
                 params["name_raw"] = f"%{name}%"
 
         if category:
-            cat_clean = category.upper()
-            if cat_clean in ["SCULTORE", "SCULTORI", "SCULTURA"]:
-                query += " AND (ac.artistcategorydescription ILIKE :category OR ac.artistcategorydescription = 'SCULTORI')"
-            elif cat_clean in ["PITTORE", "PITTORI", "PITTURA"]:
-                query += " AND (ac.artistcategorydescription ILIKE :category OR ac.artistcategorydescription = 'PITTORI')"
-            else:
-                query += " AND ac.artistcategorydescription ILIKE :category"
-            params["category"] = f"%{category}%"
+            cat_match = self._text_match("artist_category", "ac.artistcategorydescription", ":category")
+            query += f" AND ({cat_match} OR ac.artistcategorydescription = :category_eq)"
+            params["category"] = self._match_pattern("artist_category", category)
+            params["category_eq"] = _category_synonym(category, _ARTIST_SCULPT_KW, _ARTIST_PAINT_KW)
 
         query += " ORDER BY a.artistname"
 
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), params)
-            artisti = []
-            for row in result:
-                d = dict(row._mapping)
-                if d.get("category"):
-                    d["category"] = self._localize_category(d["category"], language_id)
-                artisti.append(d)
-            return artisti
-
-    def get_artista_details(self, artist_id: int, language_id: str = 'it') -> Dict[str, Any]:
+        with self._connect(conn) as conn:
+            rows = _dicts(conn.execute(text(query), params))
+        for r in rows:
+            if r["category"]:
+                r["category"] = self._localize_category(r["category"], language_id)
+        return rows
+
+    def get_artista_details(self, artist_id: int, language_id: str = 'it', conn: Optional[Connection] = None) -> Dict[str, Any]:
         """
         Dettaglio artista con biografia garantita.
         Restituisce sempre 'biography' (dal campo artist.biography) e
         'description' (dalla tabella artistdescription, con fallback su biography).
         """
-        # Step 1: base data always available from artist table
-        base_query = f"""
-            SELECT a.artistid, a.artistname, a.birthplace, a.deathplace,
-                   a.birthdate, a.deathdate, a.biography,
-                   ac.artistcategorydescription as category
-            FROM {self.schema}.artist a
-            LEFT JOIN {self.schema}.artistcategory ac ON a.artistcategoryid = ac.artistcategoryid
-            WHERE a.artistid = :id
+        # Base data (always available from artist table) plus the localized and
+        # Italian descriptions (optional, may be missing), in a single query
+        with self._connect(conn) as conn:
+            row = conn.execute(self._stmts["get_artista_details"], {"id": artist_id, "lang": language_id}).mappings().first()
+        if not row:
+            return {}
+        return self._artista_details_from_row(row, language_id)
+
+    def get_artista_details_with_opere(
+        self, site_id: int, artist_id: int, language_id: str = 'it', conn: Optional[Connection] = None
+    ) -> Dict[str, Any]:
         """
-        # Step 2: localized description (optional, may be missing)
-        desc_query = f"""
-            SELECT artistdescription, birthdeathdescription
-            FROM {self.schema}.artistdescription
-            WHERE artistid = :id AND languageid = :lang
-            LIMIT 1
+        get_artista_details plus the artist's artworks in the site, under 'opere'
+        ({titolo, tecnica, sala}; key omitted when there are none): one query.
         """
-        with self.engine.connect() as conn:
-            base = conn.execute(text(base_query), {"id": artist_id}).mappings().first()
-            if not base:
-                return {}
-
-            res = dict(base)
-            # Always clean and expose biography
-            res["biography"] = self._strip_html(res.get("biography") or "")
-
-            # Fallback 1: requested language
-            loc = conn.execute(text(desc_query), {"id": artist_id, "lang": language_id}).mappings().first()
-            if loc and loc.get("artistdescription") and len(loc["artistdescription"]) > 10:
-                res["description"] = self._strip_html(loc["artistdescription"])
-                res["birthdeathdescription"] = loc.get("birthdeathdescription") or ""
-            elif language_id != 'it':
-                # Fallback 2: Italian
-                loc_it = conn.execute(text(desc_query), {"id": artist_id, "lang": 'it'}).mappings().first()
-                if loc_it and loc_it.get("artistdescription"):
-                    res["description"] = self._strip_html(loc_it["artistdescription"])
-                    res["birthdeathdescription"] = loc_it.get("birthdeathdescription") or ""
-                    res["note"] = "Biografia disponibile solo in italiano."
-                else:
-                    res["description"] = res["biography"]
+        with self._connect(conn) as conn:
+            row = conn.execute(
+                self._stmts["get_artista_details_with_opere"],
+                {"id": artist_id, "lang": language_id, "site_id": site_id},
+            ).mappings().first()
+        if not row:
+            return {}
+        res = self._artista_details_from_row(row, language_id)
+        if row["opere"]:
+            res["opere"] = row["opere"]
+        return res
+
+    def _artista_details_from_row(self, row, language_id: str) -> Dict[str, Any]:
+        res = {k: row[k] for k in (
+            "artistid", "artistname", "birthplace", "deathplace",
+            "birthdate", "deathdate", "biography", "category",
+        )}
+        # Always clean and expose biography
+        res["biography"] = self._strip_html(res.get("biography") or "")
+
+        # Fallback 1: requested language
+        loc_desc = row["loc_description"]
+        if loc_desc and len(loc_desc) > 10:
+            res["description"] = self._strip_html(loc_desc)
+            res["birthdeathdescription"] = row["loc_birthdeath"] or ""
+        elif language_id != 'it':
+            # Fallback 2: Italian
+            if row["has_it"] and row["it_description"]:
+                res["description"] = self._strip_html(row["it_description"])
+                res["birthdeathdescription"] = row["it_birthdeath"] or ""
+                res["note"] = "Biografia disponibile solo in italiano."
             else:
-                # Fallback 3: biography field
                 res["description"] = res["biography"]
-                res["birthdeathdescription"] = ""
+        else:
+            # Fallback 3: biography field
+            res["description"] = res["biography"]
+            res["birthdeathdescription"] = ""
 
-            return res
+        return res
 
     # ------------------------------------------------------------------
     # LOCATIONS
     # ------------------------------------------------------------------
 
-    def list_locations(self, site_id: int) -> List[Dict[str, Any]]:
+    def list_locations(self, site_id: int, conn: Optional[Connection] = None) -> List[LocationRow]:
         """Lista sale ed edifici del museo."""
-        query = f"""
-            SELECT DISTINCT loc.locationid, loc.locationname, r.roomname
-            FROM {self.schema}.location loc
-            LEFT JOIN {self.schema}.room r ON loc.roomid = r.roomid
-            WHERE loc.siteid = :site_id
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"site_id": site_id})
-            return [dict(row._mapping) for row in result]
-
-    def get_location_details(self, location_id: int, language_id: str = 'it') -> Dict[str, Any]:
+        key = ("list_locations", site_id)
+        locations = self._reference_cache.get(key)
+        if locations is None:
+            with self._connect(conn) as conn:
+                locations = _dicts(conn.execute(self._stmts["list_locations"], {"site_id": site_id}))
+            self._reference_cache.set(key, locations)
+        return list(locations)
+
+    def get_location_details(self, location_id: int, language_id: str = 'it', conn: Optional[Connection] = None) -> Dict[str, Any]:
         """Recupera descrizione di una sala/location."""
-        query = f"""
-            SELECT ld.locationname, ld.locationdescription as description
-            FROM {self.schema}.locationdescription ld
-            WHERE ld.locationid = :id AND ld.languageid = :lang
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"id": location_id, "lang": language_id}).mappings().first()
+        with self._connect(conn) as conn:
+            result = conn.execute(self._stmts["get_location_details"], {"id": location_id, "lang": language_id}).mappings().first()
             if result:
                 res_dict = dict(result)
                 res_dict["description"] = self._strip_html(res_dict.get("description"))
@@ -414,41 +834,38 @@ class MuseumBroker:
     # PERCORSI
     # ------------------------------------------------------------------
 
-    def get_percorso_opere(self, site_id: int, pathway_name: str) -> List[Dict[str, Any]]:
+    def get_percorso_opere(self, site_id: int, pathway_name: str, conn: Optional[Connection] = None) -> List[PercorsoOperaRow]:
         """Opere di un percorso tematico in ordine di sequenza."""
-        query = f"""
-            SELECT aw.artistworkid, aw.artistworktitle, a.artistname, ps.sortingsequence
-            FROM {self.schema}.pathway p
-            JOIN {self.schema}.pathwayspot ps ON p.pathwayid = ps.pathwayid
-            JOIN {self.schema}.artistwork aw ON ps.artistworkid = aw.artistworkid
-            LEFT JOIN {self.schema}.artist a ON aw.artistid = a.artistid
-            WHERE p.pathwayname ILIKE :name AND aw.siteid = :site_id
-            ORDER BY ps.sortingsequence
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"name": f"%{pathway_name}%", "site_id": site_id})
-            return [dict(row._mapping) for row in result]
+        with self._connect(conn) as conn:
+            rows = _dicts(conn.execute(self._stmts["get_percorso_opere"], {"name": f"%{pathway_name}%", "site_id": site_id}))
+        return rows
 
-    def list_pathways(self, site_id: int) -> List[Dict[str, Any]]:
+    def list_pathways(self, site_id: int, conn: Optional[Connection] = None) -> List[PathwayRow]:
         """Elenca i percorsi disponibili."""
-        query = f"""
-            SELECT pathwayid, pathwayname, pathwaydescription
-            FROM {self.schema}.pathway
-            WHERE siteid = :site_id
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"site_id": site_id})
-            return [dict(row._mapping) for row in result]
-
-    def get_pathway_details(self, pathway_id: int, language_id: str = 'it') -> Dict[str, Any]:
+        key = ("list_pathways", site_id)
+        pathways = self._reference_cache.get(key)
+        if pathways is None:
+            with self._connect(conn) as conn:
+                pathways = _dicts(conn.execute(self._stmts["list_pathways"], {"site_id": site_id}))
+            self._reference_cache.set(key, pathways)
+        return list(pathways)
+
+    def find_pathway_id(self, site_id: int, name: str, conn: Optional[Connection] = None) -> Optional[int]:
+        """ID del primo percorso il cui nome contiene `name` (senza distinzione maiuscole)."""
+        # Upper-cased names are kept next to the cached list: no query, no per-row upper()
+        key = ("pathway_names", site_id)
+        names = self._reference_cache.get(key)
+        if names is None:
+            names = tuple(((p["pathwayname"] or "").upper(), p["pathwayid"])
+                          for p in self.list_pathways(site_id, conn=conn))
+            self._reference_cache.set(key, names)
+        name_up = name.upper()
+        return next((pid for p_name, pid in names if name_up in p_name), None)
+
+    def get_pathway_details(self, pathway_id: int, language_id: str = 'it', conn: Optional[Connection] = None) -> Dict[str, Any]:
         """Dettagli e descrizione di un percorso."""
-        query = f"""
-            SELECT pathwayname, pathwaydescription as description
-            FROM {self.schema}.pathwaydescription
-            WHERE pathwayid = :id AND languageid = :lang
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"id": pathway_id, "lang": language_id}).mappings().first()
+        with self._connect(conn) as conn:
+            result = conn.execute(self._stmts["get_pathway_details"], {"id": pathway_id, "lang": language_id}).mappings().first()
             if result:
                 res = dict(result)
                 res["description"] = self._strip_html(res.get("description"))
@@ -459,58 +876,58 @@ class MuseumBroker:
     # CATEGORIE / TECNICHE / MUSEO
     # ------------------------------------------------------------------
 
-    def list_categories(self, site_id: int) -> List[str]:
+    def list_categories(self, site_id: int, conn: Optional[Connection] = None) -> List[str]:
         """Categorie artisti presenti nel sito."""
-        query = f"""
-            SELECT DISTINCT ac.artistcategorydescription
-            FROM {self.schema}.artistcategory ac
-            JOIN {self.schema}.artist a ON ac.artistcategoryid = a.artistcategoryid
-            WHERE a.siteid = :site_id
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"site_id": site_id})
-            return [row[0] for row in result if row[0]]
-
-    def list_techniques(self, site_id: int) -> List[str]:
+        key = ("list_categories", site_id)
+        categories = self._reference_cache.get(key)
+        if categories is None:
+            with self._connect(conn) as conn:
+                values = conn.execute(self._stmts["list_categories"], {"site_id": site_id}).scalars().all()
+            categories = [v for v in values if v]
+            self._reference_cache.set(key, categories)
+        return list(categories)
+
+    def list_techniques(self, site_id: int, conn: Optional[Connection] = None) -> List[str]:
         """Tecniche utilizzate nelle opere del sito."""
-        query = f"""
-            SELECT DISTINCT t.techniquedescription
-            FROM {self.schema}.technique t
-            JOIN {self.schema}.artistwork aw ON t.techniqueid = aw.techniqueid
-            WHERE aw.siteid = :site_id
-            ORDER BY t.techniquedescription
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"site_id": site_id})
-            return [row[0] for row in result if row[0]]
-
-    def get_museum_info(self, site_id: int) -> Dict[str, Any]:
-        """Informazioni istituzionali del museo."""
-        query = f"""
-            SELECT sitename, sitedescription, history, architecture,
-                   address, city, country, telephone, email
-            FROM {self.schema}.site
-            WHERE siteid = :site_id
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"site_id": site_id}).mappings().first()
+        key = ("list_techniques", site_id)
+        techniques = self._reference_cache.get(key)
+        if techniques is None:
+            with self._connect(conn) as conn:
+                values = conn.execute(self._stmts["list_techniques"], {"site_id": site_id}).scalars().all()
+            techniques = [v for v in values if v]
+            self._reference_cache.set(key, techniques)
+        return list(techniques)
+
+    def get_museum_info(self, site_id: int, conn: Optional[Connection] = None) -> MappingProxyType:
+        """Informazioni istituzionali del museo (read-only: il valore è condiviso dalla cache)."""
+        key = ("get_museum_info", site_id)
+        info = self._reference_cache.get(key)
+        if info is None:
+            with self._connect(conn) as conn:
+                result = conn.execute(self._stmts["get_museum_info"], {"site_id": site_id}).mappings().first()
+            res = {}
             if result:
                 res = dict(result)
                 res["sitedescription"] = self._strip_html(res.get("sitedescription"))
                 res["history"] = self._strip_html(res.get("history"))
                 res["architecture"] = self._strip_html(res.get("architecture"))
-                return res
-        return {}
+            info = MappingProxyType(res)
+            self._reference_cache.set(key, info)
+        return info
 
-    def list_artworks_in_room(self, site_id: int, room_id: int) -> List[Dict[str, Any]]:
+    def list_artworks_in_room(self, site_id: int, room_id: int, conn: Optional[Connection] = None) -> List[ArtworkRef]:
         """Opere nella stessa sala (max 5)."""
-        query = f"""
-            SELECT aw.artistworkid, aw.artistworktitle, a.artistname
-            FROM {self.schema}.artistwork aw
-            LEFT JOIN {self.schema}.artist a ON aw.artistid = a.artistid
-            WHERE aw.siteid = :site_id AND aw.roomid = :room_id
-            LIMIT 5
-        """
-        with self.engine.connect() as conn:
-            result = conn.execute(text(query), {"site_id": site_id, "room_id": room_id})
-            return [dict(row._mapping) for row in result]
+        with self._connect(conn) as conn:
+            rows = _dicts(conn.execute(self._stmts["list_artworks_in_room"], {"site_id": site_id, "room_id": room_id}))
+        return rows
+
+    def list_artworks_in_rooms(self, site_id: int, room_ids: List[int], conn: Optional[Connection] = None) -> Dict[int, List[ArtworkRef]]:
+        """Opere per più sale in un'unica query (max 5 per sala): roomid -> opere."""
+        if not room_ids:
+            return {}
+        with self._connect(conn) as conn:
+            rows = conn.execute(self._stmts["list_artworks_in_rooms"], {"site_id": site_id, "room_ids": list(room_ids)}).mappings().all()
+        return {
+            room_id: [{k: r[k] for k in ("artistworkid", "artistworktitle", "artistname")} for r in group]
+            for room_id, group in groupby(rows, key=itemgetter("roomid"))
+        }
@@ -1,6 +1,20 @@
 import re
-import sqlparse
-from typing import List
+from typing import Any, Collection, List, Optional
+
+# Compiled once: every LLM-generated query goes through validate_sql.
+# The alternation is scanned in a single pass (word boundaries avoid e.g. "altare").
+_FORBIDDEN_RE = re.compile(
+    r"\b(?:DROP|DELETE|INSERT|UPDATE|ALTER|TRUNCATE|GRANT|CREATE|REPLACE|MERGE|CALL|COPY|VACUUM)\b"
+)
+# Table referenced after FROM/JOIN (optionally schema-qualified)
+_TABLE_RE = re.compile(r"(?:FROM|JOIN)\s+([a-zA-Z0-9_\.]+)", re.IGNORECASE)
+# siteid compared with a literal, either side, column optionally qualified/quoted and
+# value optionally quoted: siteid = 1, aw.siteid='1', "siteid" = 1, 1 = aw."siteid"
+_SITE_FILTER_RE = re.compile(
+    r"""\bSITEID"?\s*=\s*'?(\d+)\b'?"""
+    r"""|(?<![\w.'])'?(\d+)'?\s*=\s*(?:"?\w+"?\.)?"?SITEID\b""",
+    re.IGNORECASE,
+)
 
 class SQLGuardrails:
     """
@@ -10,19 +24,18 @@ class SQLGuardrails:
     ALLOWED_COMMANDS = {'SELECT'}
 
     @staticmethod
-    def validate_sql(sql: str, allowed_tables: list[str]) -> bool:
+    def validate_sql(sql: str, allowed_tables: list[str]) -> List[str]:
         """
         Parses SQL to ensure it's a safe SELECT query on allowed tables.
+        Returns the referenced table names (lower-cased, without schema prefix).
         """
         # Clean the SQL
         sql_clean = sql.strip().upper()
         
         # 1. Block destructive keywords absolutely
-        forbidden = ["DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "TRUNCATE", "GRANT", "CREATE", "REPLACE"]
-        for word in forbidden:
-            # Match word with boundaries to avoid false positives (e.g. "altare")
-            if re.search(rf"\b{word}\b", sql_clean):
-                raise ValueError(f"Forbidden SQL command detected: {word}")
+        forbidden = _FORBIDDEN_RE.search(sql_clean)
+        if forbidden:
+            raise ValueError(f"Forbidden SQL command detected: {forbidden.group(0)}")
 
         # 2. Must start with SELECT
         if not sql_clean.startswith("SELECT"):
@@ -32,12 +45,29 @@ class SQLGuardrails:
         # We check that every word following a FROM or JOIN is in the allowed list
         # This is a heuristic but much safer than no check.
         # Format: FROM table, JOIN table
-        pattern = r"(?:FROM|JOIN)\s+([a-zA-Z0-9_\.]+)"
-        matches = re.findall(pattern, sql_clean, re.IGNORECASE)
-        for match in matches:
+        allowed = {t.lower() for t in allowed_tables}
+        tables = []
+        for match in _TABLE_RE.finditer(sql_clean):
             # Remove schema prefix if present
-            table_name = match.split(".")[-1]
-            if table_name.lower() not in [t.lower() for t in allowed_tables]:
+            table_name = match.group(1).rsplit(".", 1)[-1]
+            if table_name.lower() not in allowed:
                 raise ValueError(f"Access to table '{table_name}' is not authorized.")
+            tables.append(table_name.lower())
+
+        return tables
 
-        return True
+    @staticmethod
+    def missing_site_filter(sql: str, tables: List[str], siteid_tables: Collection[str], site_id: Any) -> Optional[str]:
+        """
+        First of `tables` (as returned by validate_sql) that has a siteid column while
+        the query doesn't compare siteid with the current site. None if the query is scoped.
+        A regex check, not a parse: it only looks for the comparison, so a filter
+        neutralized by OR (siteid = 1 OR 1=1) or scoping just one of the tables
+        is not detected.
+        """
+        scoped = [t for t in tables if t in siteid_tables]
+        if not scoped:
+            return None
+        if int(site_id) in {int(a or b) for a, b in _SITE_FILTER_RE.findall(sql)}:
+            return None
+        return scoped[0]
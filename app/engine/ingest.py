@@ -1,8 +1,72 @@
+import asyncio
+import logging
 import os
+from typing import List
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.utils import get_tokenizer
 from app.core.factory import LLMFactory
+from app.core.cached_embed import CachedEmbedding
 from app.core.security import decrypt_key
 
+logger = logging.getLogger(__name__)
+
+# Nodes inserted per batch while building the index
+INSERT_BATCH_SIZE = 2048
+# Embedding batches run concurrently, each kept under a token budget so a
+# burst stays within the provider's tokens-per-minute limit
+INGEST_WORKERS = 8
+MAX_TOKENS_PER_BATCH = 8000
+# Retries on rate limiting (HTTP 429), with exponential backoff
+EMBED_MAX_RETRIES = 5
+EMBED_BACKOFF_BASE = 1.0
+
+
+def _token_batches(nodes: List[BaseNode], max_tokens: int) -> List[List[BaseNode]]:
+    """Groups nodes into consecutive batches of at most `max_tokens` input tokens."""
+    tokenizer = get_tokenizer()
+    batches, current, current_tokens = [], [], 0
+    for node in nodes:
+        n_tokens = len(tokenizer(node.get_content(metadata_mode=MetadataMode.EMBED)))
+        if current and current_tokens + n_tokens > max_tokens:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(node)
+        current_tokens += n_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_rate_limit(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return status == 429 or "429" in str(e) or "rate limit" in str(e).lower()
+
+
+async def _embed_nodes(nodes: List[BaseNode], embed_model) -> None:
+    """Embeds nodes in place: token-budgeted batches, INGEST_WORKERS at a time."""
+    semaphore = asyncio.Semaphore(INGEST_WORKERS)
+
+    async def embed_batch(batch: List[BaseNode]):
+        texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in batch]
+        async with semaphore:
+            for attempt in range(EMBED_MAX_RETRIES + 1):
+                try:
+                    embeddings = await embed_model.aget_text_embedding_batch(texts)
+                    break
+                except Exception as e:
+                    if attempt == EMBED_MAX_RETRIES or not _is_rate_limit(e):
+                        raise
+                    delay = EMBED_BACKOFF_BASE * 2 ** attempt
+                    logger.warning("[INGEST] Rate limited, retry in %.0fs", delay)
+                    await asyncio.sleep(delay)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+
+    await asyncio.gather(*(embed_batch(b) for b in _token_batches(nodes, MAX_TOKENS_PER_BATCH)))
+
+
 # Mock config retrieval for ingestion (similar to routes.py)
 # In prod, this would be an async worker task
 def build_index_for_tenant(tenant_id: str, source_dir: str, output_dir: str, api_key_enc: str, provider: str):
@@ -17,26 +81,32 @@ def build_index_for_tenant(tenant_id: str, source_dir: str, output_dir: str, api
     # 1. Setup Tenant LLM context 
     real_key = decrypt_key(api_key_enc)
     from app.core.factory import EmbedModelFactory
-    from llama_index.core import Settings
     
-    embed_model = EmbedModelFactory.create_embed_model(provider, real_key)
+    # Unchanged chunks (re-ingesting the same files) are served from the embedding cache.
+    # Own model instance: the batches below run on a private event loop (asyncio.run)
+    embed_model = CachedEmbedding.wrap(EmbedModelFactory.create_embed_model(provider, real_key, shared=False))
+    # Passed explicitly below: no global Settings mutation (concurrent tenant builds)
     llm = LLMFactory.create_llm(provider, real_key)
     
-    Settings.llm = llm
-    Settings.embed_model = embed_model
-    
     # 2. Load Data
     documents = SimpleDirectoryReader(source_dir).load_data()
     print(f"Loaded {len(documents)} documents for {tenant_id}")
     
-    # 3. Create Index
-    index = VectorStoreIndex.from_documents(
-        documents,
+    # 3. Split and embed (concurrent, token-budgeted batches)
+    nodes = SentenceSplitter().get_nodes_from_documents(documents, show_progress=True)
+    asyncio.run(_embed_nodes(nodes, embed_model))
+    print(f"Embedded {len(nodes)} chunks for {tenant_id}")
+
+    # 4. Create Index (nodes already carry their embeddings)
+    index = VectorStoreIndex(
+        nodes,
         embed_model=embed_model,
-        llm=llm
+        llm=llm,
+        insert_batch_size=INSERT_BATCH_SIZE,
+        show_progress=True
     )
 
-    # 4. Save to Disk
+    # 5. Save to Disk
     index.storage_context.persist(persist_dir=output_dir)
     print(f"Index saved to {output_dir}")
 
@@ -1,24 +1,186 @@
-from llama_index.core import VectorStoreIndex, SQLDatabase, Settings, PromptTemplate
-from llama_index.core.query_engine import NLSQLTableQueryEngine, SQLTableRetrieverQueryEngine
-from llama_index.core.objects import SQLTableNodeMapping, ObjectIndex, SQLTableSchema
+from llama_index.core import SQLDatabase, StorageContext, load_index_from_storage
+from llama_index.core.query_engine import SQLTableRetrieverQueryEngine
 from llama_index.core.tools import QueryEngineTool, ToolMetadata, FunctionTool
-from llama_index.core.agent import FunctionAgent, AgentStream
+from llama_index.core.agent import FunctionAgent, ReActAgent, AgentStream
 from app.core.factory import LLMFactory, EmbedModelFactory
+from app.core.cached_embed import CachedEmbedding
+from app.core.config import settings
+from app.engine.semantic_cache import SemanticCache
+from app.core.db import get_engine
+from app.core.cache import LRUCache, TTLCache
 from app.engine.guardrails import SQLGuardrails
+from app.engine.broker import MuseumBroker
+from sqlalchemy import event, inspect, text
 import os
+import html
 import json
+import hashlib
 import asyncio
 from llama_index.core.llms import ChatMessage, MessageRole
 from typing import List, Any, Dict, Optional
 import time
 import traceback
 import re
+import contextlib
 import contextvars
-
-# Global context for multi-site isolation within cached pipelines
+import logging
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json below
+    orjson = None
+
+# Global context for multi-site isolation within cached pipelines.
+# Set per request by query()/astream_query(); the agent's workflow tasks inherit the
+# caller's context and FunctionTool runs sync tools in an executor through
+# contextvars.copy_context(), so every tool call sees the values of its own request.
 ctx_site_id = contextvars.ContextVar("site_id", default=None)
 ctx_audience_target = contextvars.ContextVar("audience_target", default="STD")
 ctx_language_id = contextvars.ContextVar("language_id", default="it")
+ctx_session_id = contextvars.ContextVar("session_id", default="default")
+
+# Reflected SQLDatabase per (DSN digest, schema, reflected tables).
+# Reflection costs dozens of catalog queries; a pipeline rebuilt after a tenant
+# update that didn't touch the DB config reuses it (and its inspector cache).
+SQL_DATABASE_CACHE_SIZE = 32
+_sql_databases = LRUCache(maxsize=SQL_DATABASE_CACHE_SIZE)
+
+# Conversation memory: last N messages per session, at most MAX_SESSIONS sessions
+# per pipeline (least recently active ones are dropped)
+SESSION_HISTORY_LEN = 10
+MAX_SESSIONS = 1000
+
+# Text-to-SQL results per (normalized request, site): repeated FAQs skip the
+# LLM SQL generation and the DB round trip. The guide DB is read-only for the
+# pipeline (guardrails reject writes), so entries only need to age out.
+SQL_RESULT_CACHE_SIZE = 256
+SQL_RESULT_CACHE_TTL = 300
+# Rows returned by the SQL tool
+SQL_ROW_LIMIT = 500
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+DB_INTELLIGENCE_PATH = os.path.join(_DATA_DIR, "db_intelligence.json")
+SEMANTIC_DICTIONARY_PATH = os.path.join(_DATA_DIR, "semantic_dictionary.json")
+
+# Keyed on the file mtime: editing the JSON invalidates the cached entries
+@lru_cache(maxsize=8)
+def _load_db_intelligence(path: str, mtime_ns: int) -> Dict[str, Any]:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+@lru_cache(maxsize=8)
+def _load_semantic_dictionary(path: str, mtime_ns: int) -> Dict[str, Any]:
+    # Shared across pipelines: treat the returned dict as read-only
+    with open(path, 'rb') as f:
+        return json.loads(f.read())
+
+_SITEID_COLUMN_RE = re.compile(r'\bsiteid\b', re.IGNORECASE)
+
+@lru_cache(maxsize=8)
+def _siteid_tables(path: str, mtime_ns: int) -> frozenset:
+    """Lower-cased names of the tables whose DDL has a siteid column (static per db_intelligence.json)."""
+    return frozenset(
+        t_name.lower() for t_name, t_info in _load_db_intelligence(path, mtime_ns).get("tables", {}).items()
+        if _SITEID_COLUMN_RE.search(t_info.get("ddl", ""))
+    )
+
+def _tool_json(obj: Any) -> str:
+    """Tool result as indented JSON text for the agent (orjson's C encoder when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str).decode()
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=str)
+
+logger = logging.getLogger(__name__)
+sql_logger = logging.getLogger(__name__ + ".sql")
+
+# The system prompt embeds the DDL: built once per db_intelligence.json version
+@lru_cache(maxsize=8)
+def _build_system_prompt(path: Optional[str], mtime_ns: Optional[int]) -> str:
+    """Agent system prompt, with the DDL of every table in db_intelligence.json."""
+    tables = _load_db_intelligence(path, mtime_ns).get("tables", {}) if path else {}
+    schema_ddl_str = "\n".join(t_info["ddl"] for t_info in tables.values())
+
+    system_prompt = (
+        "Sei l'Assistente AI Senior del Museo Bailo. Rispondi alle domande degli utenti interrogando il database.\n\n"
+        "### SALUTI E CONVERSAZIONE:\n"
+        "Se l'utente invia un saluto, un ringraziamento o una frase conversazionale generica, "
+        "rispondi direttamente con cortesia senza chiamare alcun tool.\n\n"
+        "### REGOLE DI RISPOSTA:\n"
+        "1. PRIORITÀ TOOL: Usa sempre 'get_artist_info' e 'get_artwork_info' passando il NOME o il TITOLO come stringa.\n"
+        "2. NO ID ALLUCINATI: Non inventare mai ID numerici. Se non conosci l'ID, usa i tool che accettano nomi.\n"
+        "3. RISPOSTA COMPLETA: Quando trovi un artista o un'opera, fornisci subito biografia/descrizione e lista opere/tecnica.\n"
+        "4. TONO: Formale, colto, ma accessibile.\n"
+        "5. LINGUA: Rispondi nella lingua dell'utente.\n"
+        "6. PIÙ OPERE: Se hai già 2 o più artistworkid, usa 'get_artworks_details_bulk' con tutti gli ID in una sola chiamata.\n\n"
+        "### KNOWLEDGE SOURCE: DATABASE SCHEMA (DDL)\n"
+        f"{schema_ddl_str}\n\n"
+        "### PROTOCOLO TECNICO:\n"
+        "- Quando un tool restituisce testi lunghi (biografie, descrizioni di opere), riportali INTEGRALMENTE senza tagli o riassunti.\n"
+        "- Non menzionare mai SQL, tabelle, ID o dettagli tecnici interni all'utente.\n"
+    )
+
+    return system_prompt
+
+# SQL tool: cleanup of the raw result text
+_TAG_BLOCK_RE = re.compile(r'<(p|br|div)[^>]*>', re.IGNORECASE)
+_TAG_ANY_RE = re.compile(r'<[^>]+>')
+_MULTI_SPACE_RE = re.compile(r' +')
+_DBL_NL_RE = re.compile(r'\n\s*\n')
+
+# Response sanitization: leaks of tool internals into the final answer, removed in a
+# single pass. Technical leaks: internal tokens, siteid filters, SQL code fences.
+_TECHNICAL_LEAKS = (
+    r'\[\[DIRECT_DISPLAY\]\]'
+    r'|\[siteid=\d+\]'
+    r'|\(FILTRO OBBLIGATORIO[^)]*\)'
+    r'|(?i:\bsiteid\s*=\s*\d+)'
+    r'|```sql\s*.*?```'
+)
+# Internal IDs with their value, technical field names
+_INTERNAL_FIELDS = (
+    r'(?i:\b(?:artistid|artistworkid|siteid|roomid|locationid)[:\s=]+\d+\b'
+    r'|\b(?:inventorynumber|imageref|artist_alias)[:\s=]+)'
+)
+_TECHNICAL_LEAKS_RE = re.compile(_TECHNICAL_LEAKS, re.DOTALL)
+_ALL_LEAKS_RE = re.compile(f"{_TECHNICAL_LEAKS}|{_INTERNAL_FIELDS}", re.DOTALL)
+_EXCESS_NL_RE = re.compile(r'\n{3,}')
+# Lower-cased literals every leak above contains: answers with none of them skip the regex
+_LEAK_TOKENS = ('[[direct_display]]', 'filtro obbligatorio', '```sql', 'siteid', 'artistid',
+                'artistworkid', 'roomid', 'locationid', 'inventorynumber', 'imageref', 'artist_alias')
+
+# Simple language detection: whole-word cues, checked in order (Italian otherwise)
+_WORD_TOKEN_RE = re.compile(r"\w+")
+_LANG_CUES = (
+    ("en", frozenset({"english", "what", "tell", "where", "who", "describe", "show"})),
+    ("fr", frozenset({"français", "qu", "raconte", "où", "décris"})),
+    ("es", frozenset({"español", "qué", "cuéntame", "donde", "está"})),
+)
+
+def _detect_lang(user_query: str) -> str:
+    tokens = set(_WORD_TOKEN_RE.findall(user_query.lower()))
+    for lang, cues in _LANG_CUES:
+        if not tokens.isdisjoint(cues):
+            return lang
+    return "it"
+
+def _list_tables(engine, schema: Optional[str]) -> List[str]:
+    """Table names of `schema`: a single pg_tables query on PostgreSQL, the inspector elsewhere."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            return list(conn.execute(
+                text("SELECT tablename FROM pg_catalog.pg_tables WHERE schemaname = :s"),
+                {"s": schema or "public"},
+            ).scalars())
+    return inspect(engine).get_table_names(schema=schema)
+
+def _log_sql_statement(conn, cursor, statement, parameters, context, executemany):
+    """Diagnostic SQL logging hook for pipeline engines (only wired when NOESIS_SQL_TRACE is set)."""
+    if sql_logger.isEnabledFor(logging.DEBUG):
+        sql_logger.debug("[SQL] Executing: %s", statement)
+        if parameters:
+            sql_logger.debug("[SQL] Parameters: %s", parameters)
 
 class TenantQueryPipeline:
     def __init__(
@@ -37,43 +199,41 @@ class TenantQueryPipeline:
         
         # 1. Initialize per-tenant LLM and Embed Model
         self.llm = LLMFactory.create_llm(llm_provider, llm_api_key, llm_model)
-        self.embed_model = EmbedModelFactory.create_embed_model(llm_provider, llm_api_key)
+        self.embed_model = CachedEmbedding.wrap(EmbedModelFactory.create_embed_model(llm_provider, llm_api_key))
 
-        # 2. Set global Settings for this request/tenant
-        Settings.llm = self.llm
-        Settings.embed_model = self.embed_model
-        
-        if llm_provider == "openai":
-            os.environ["OPENAI_API_KEY"] = llm_api_key
-        elif llm_provider == "anthropic":
-            os.environ["ANTHROPIC_API_KEY"] = llm_api_key
-        elif llm_provider == "groq":
-            os.environ["GROQ_API_KEY"] = llm_api_key
-        elif llm_provider == "gemini":
-            os.environ["GOOGLE_API_KEY"] = llm_api_key
-            
+        # Semantic answer cache (needs an embed model to compare questions)
+        self.semantic_cache = None
+        if self.embed_model is not None:
+            try:
+                self.semantic_cache = SemanticCache(os.path.join(settings.SEMANTIC_CACHE_DIR, f"{tenant_id}.db"))
+            except Exception as e:
+                logger.warning("Semantic cache disabled: %s", e)
+
+        # No global Settings / os.environ: llm and embed_model are passed explicitly
+        # to every component, so concurrent tenants can't swap each other's models or keys
         print(f"--- Pipeline Init: Tenant {tenant_id} ({llm_provider}) ---")
         
         # 2. Tools list
         self.query_tools = []
         
         # 3. Session memory: storing actual ChatMessage objects
-        self.session_memory: Dict[str, List[ChatMessage]] = {}
+        self.session_memory: "OrderedDict[str, deque[ChatMessage]]" = OrderedDict()
 
         # Per-session SQL bypass buffer (avoids race conditions between concurrent users)
         self._sql_bypass: Dict[str, Optional[str]] = {}
-        # Per-session Focus (Last entities viewed)
+        # Text-to-SQL results shared by all sessions of this pipeline
+        self._sql_results = TTLCache(maxsize=SQL_RESULT_CACHE_SIZE, ttl=SQL_RESULT_CACHE_TTL)
+        # Per-session Focus (Last entities viewed), dropped with the session (see _session_history)
         self.session_focus: Dict[str, Dict[str, Any]] = {}
-        # Legacy single-buffer kept for backward compat with streaming path
-        self.last_sql_result = None
         self.db_intel = {}
         
-        # Load local database intelligence (DDL, Samples)
+        # Load local database intelligence (DDL, Samples): parsed once per file version
+        intel_key = None
         try:
-            intel_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "db_intelligence.json")
-            if os.path.exists(intel_path):
-                with open(intel_path, 'r') as f:
-                    self.db_intel = json.load(f)
+            if os.path.exists(DB_INTELLIGENCE_PATH):
+                key = (DB_INTELLIGENCE_PATH, os.stat(DB_INTELLIGENCE_PATH).st_mtime_ns)
+                self.db_intel = _load_db_intelligence(*key)
+                intel_key = key
                 print(f"--- Loaded Intelligence for {len(self.db_intel.get('tables', {}))} tables ---")
         except Exception as e:
             print(f"[ERROR] Failed to load db_intelligence: {e}")
@@ -82,23 +242,24 @@ class TenantQueryPipeline:
             
             # --- DOMAIN INTELLIGENCE: Load Semantic Paradigm first to optimize reflection ---
             try:
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                dict_path = os.path.join(os.path.dirname(os.path.dirname(current_dir)), "data", "semantic_dictionary.json")
-                with open(dict_path, 'r') as f:
-                    sem_paradigm = json.load(f)
+                sem_paradigm = _load_semantic_dictionary(
+                    SEMANTIC_DICTIONARY_PATH, os.stat(SEMANTIC_DICTIONARY_PATH).st_mtime_ns
+                )
             except Exception as e:
                 print(f"[ERROR] Critical: Failed to load semantic paradigm: {e}")
                 sem_paradigm = {"tables": {}}
 
-            from sqlalchemy import create_engine, event
-            engine = create_engine(sql_connection_str)
+            # Engines are shared per DSN: reuse the pool across pipeline rebuilds
+            engine = get_engine(sql_connection_str)
             
-            # Diagnostic SQL Logging: Capture every query executed on this engine
-            @event.listens_for(engine, "before_cursor_execute")
-            def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-                print(f"[SQL] Executing: {statement}")
-                if parameters:
-                    print(f"[SQL] Parameters: {parameters}")
+            # Diagnostic SQL Logging (opt-in): Capture every query executed on this engine
+            # (registered once per shared engine, not once per pipeline; dropped again when
+            # tracing is turned off, so untraced engines run no hook at all)
+            traced = event.contains(engine, "before_cursor_execute", _log_sql_statement)
+            if settings.NOESIS_SQL_TRACE and not traced:
+                event.listen(engine, "before_cursor_execute", _log_sql_statement)
+            elif traced and not settings.NOESIS_SQL_TRACE:
+                event.remove(engine, "before_cursor_execute", _log_sql_statement)
             
             # Optimization: strictly reflect only what's in our semantic dictionary
             # plus any specifically allowed tables that aren't '*'
@@ -107,171 +268,80 @@ class TenantQueryPipeline:
             
             if allowed_tables and "*" not in allowed_tables:
                 # Further restrict if the tenant has a whitelist
-                tables_to_reflect = [t for t in known_tables if t in allowed_tables]
+                # (lowered once into a set: O(1) case-insensitive membership)
+                allowed = frozenset(t.lower() for t in allowed_tables)
+                tables_to_reflect = [t for t in known_tables if t.lower() in allowed]
             
             print(f"--- Restricting reflection to {len(tables_to_reflect)} tables ---")
 
-            self.sql_database = SQLDatabase(
-                engine, 
-                schema=self.schema_name, 
-                include_tables=tables_to_reflect, 
-                max_string_length=10000
-            )
-
-            # --- BROKER INITIALIZATION (Atomic Tools Layer) ---
-            from app.engine.broker import MuseumBroker
-            self.broker = MuseumBroker(self.sql_database.engine, schema=self.schema_name or "guide")
-
-            # 1. Table Context for Indexer (Filtered by strictly needed tables)
-            from llama_index.core.objects import SQLTableNodeMapping, ObjectIndex, SQLTableSchema
-            table_node_mapping = SQLTableNodeMapping(self.sql_database)
-            table_schema_objs = []
-            
-            # Only index tables that we actually have in our semantic map
-            for t in tables_to_reflect:
-                table_info = sem_paradigm.get("tables", {}).get(t.lower(), {})
-                raw_desc = table_info.get("description", f"Dati relativi a {t}")
-                desc = raw_desc if isinstance(raw_desc, str) else raw_desc.get("it", f"Dati relativi a {t}")
-                table_schema_objs.append(SQLTableSchema(table_name=t, context_str=desc))
-            
-            obj_index = ObjectIndex.from_objects(
-                table_schema_objs,
-                table_node_mapping,
-                VectorStoreIndex,
+            reflection_key = (
+                hashlib.sha256(sql_connection_str.encode()).digest(),
+                self.schema_name,
+                tuple(tables_to_reflect)
             )
+            self.sql_database = _sql_databases.get(reflection_key)
+            if self.sql_database is None:
+                # One metadata-only call to drop dictionary tables missing from this DB,
+                # then a single reflection of what's left
+                existing = {t.lower(): t for t in _list_tables(engine, self.schema_name)}
+                self.sql_database = SQLDatabase(
+                    engine, 
+                    schema=self.schema_name, 
+                    include_tables=[existing[t.lower()] for t in tables_to_reflect if t.lower() in existing], 
+                    max_string_length=10000
+                )
+                _sql_databases.set(reflection_key, self.sql_database)
+            else:
+                logger.debug("Reusing reflected schema")
 
-            # 2. Global Agent System Prompt
-            # 1. CORE ARCHITECTURE: DDL & SCHEMA AWARENESS
-            # We build our knowledge base by extracting DDLs and data samples from the db_intel configuration.
-            ddl_blocks = []
-            sample_blocks = []
-            for t_name, t_info in self.db_intel.get("tables", {}).items():
-                ddl_blocks.append(t_info["ddl"])
-                if t_info.get("sample_values"):
-                    samples = ", ".join([f"{k}: {v}" for k, v in t_info["sample_values"].items()])
-                    sample_blocks.append(f"Table {t_name} samples -> {samples}")
-
-            # Consolidate DDL and samples
-            schema_ddl_str = "\n".join(ddl_blocks)
-            samples_hint_str = "\n".join(sample_blocks)
-            
-            # --- SYSTEM PROMPT ---
-            self.context_to_inject = (
-                "Sei l'Assistente AI Senior del Museo Bailo. Rispondi alle domande degli utenti interrogando il database.\n\n"
-                "### SALUTI E CONVERSAZIONE:\n"
-                "Se l'utente invia un saluto, un ringraziamento o una frase conversazionale generica, "
-                "rispondi direttamente con cortesia senza chiamare alcun tool.\n\n"
-                "### REGOLE DI RISPOSTA:\n"
-                "1. PRIORITÀ TOOL: Usa sempre 'get_artist_info' e 'get_artwork_info' passando il NOME o il TITOLO come stringa.\n"
-                "2. NO ID ALLUCINATI: Non inventare mai ID numerici. Se non conosci l'ID, usa i tool che accettano nomi.\n"
-                "3. RISPOSTA COMPLETA: Quando trovi un artista o un'opera, fornisci subito biografia/descrizione e lista opere/tecnica.\n"
-                "4. TONO: Formale, colto, ma accessibile.\n"
-                "5. LINGUA: Rispondi nella lingua dell'utente.\n\n"
-                "### KNOWLEDGE SOURCE: DATABASE SCHEMA (DDL)\n"
-                f"{schema_ddl_str}\n\n"
-                "### PROTOCOLO TECNICO:\n"
-                "- Quando un tool restituisce testi lunghi (biografie, descrizioni di opere), riportali INTEGRALMENTE senza tagli o riassunti.\n"
-                "- Non menzionare mai SQL, tabelle, ID o dettagli tecnici interni all'utente.\n"
-            )
+            # Tables needing the siteid filter, read from the DDL: the guardrails only let through
+            # tables listed in db_intelligence.json, so no inspector call is needed per query
+            self._siteid_tables = _siteid_tables(*intel_key) if intel_key else frozenset()
 
-            # --- TEXT-TO-SQL PROMPT (The Archive Access) ---
-            TEXT_TO_SQL_PROMPT_STR = (
-                "Sei un esperto Senior PostgreSQL per il Museo Bailo. Genera query sintatticamente perfette.\n\n"
-                "REGOLE CRITICHE:\n"
-                "1. NOMI TABELLE: NON usare mai prefissi di schema. Usa nomi semplici (es. 'artistwork', non 'guide.artistwork').\n"
-                "2. Restituisci esclusivamente SQL (SELECT).\n"
-                "3. siteid: Applica il filtro 'siteid = 1' SOLO alle tabelle che mostrano la colonna 'siteid' nel DDL sottostante.\n"
-                "4. TECNICA/MATERIALE: Filtra SEMPRE per tecnica usando un JOIN con la tabella 'technique' su 'techniquedescription'. "
-                "NON cercare mai un materiale o una tecnica in 'artistworkdescription' o 'artistworktitle' — quei campi contengono testo narrativo che può essere fuorviante. "
-                "Esempio CORRETTO: JOIN technique t ON aw.techniqueid = t.techniqueid WHERE t.techniquedescription ILIKE '%%bronzo%%'. "
-                "Esempio SBAGLIATO: WHERE aw.artistworkdescription ILIKE '%%bronzo%%'.\n"
-                "5. RICERCA APERTA (tema, nome, titolo): Usa ILIKE su 'artistworktitle', 'artistworkdescription', 'artistname', 'biography' solo per ricerche per tema o parola chiave generica (NON per filtrare materiali).\n"
-                "STRUTTURA REALE (DDL):\n"
-                f"{schema_ddl_str}\n\n"
-                "CAMPIONI DATI:\n"
-                f"{samples_hint_str}\n\n"
-                "Domanda: {query_str}\n"
-                "SQLQuery: "
+            # --- BROKER INITIALIZATION (Atomic Tools Layer) ---
+            self.broker = MuseumBroker(
+                self.sql_database.engine,
+                schema=self.schema_name or "guide",
+                prefix_match=settings.BROKER_PREFIX_MATCH,
             )
 
-            # Custom response synthesis prompt (for the Query Engine internally)
-            RESPONSE_SYNTHESIS_PROMPT_STR = (
-                "1. SE TROVI PIÙ RIGHE: \n"
-                "   - Se i titoli delle opere sono diversi, elenca i titoli e chiedi quale approfondire.\n"
-                "   - Se il titolo è lo stesso o si tratta di LISTE, ELENCA semplicemente tutte le informazioni trovate in modo discorsivo o puntato.\n"
-                "2. Se hai una descrizione (biografia/opera), riportala integralmente senza tagli.\n"
-                "3. DIVIETO DI SCUSE: Restituisci solo i dati finali.\n\n"
-                "Domanda: {query_str}\n"
-                "Dati dal DB: {context_str}\n"
-                "Risposta: "
-            )
+            # 2. Global Agent System Prompt (memoized per db_intelligence.json version)
+            self.context_to_inject = _build_system_prompt(*(intel_key or (None, None)))
 
             self.sem_paradigm = sem_paradigm
-            
-            self.sql_engine = NLSQLTableQueryEngine(
-                self.sql_database,
-                tables=tables_to_reflect,
-                llm=self.llm,
-                sql_limit=500,
-                synthesize_response=False,
-                context_str="\n".join([f"Info on tables: {schema_ddl_str}", f"Info on samples: {samples_hint_str}"]),
-                text_to_sql_prompt=PromptTemplate(TEXT_TO_SQL_PROMPT_STR)
-            )
-            
+
             # Sophisticated wrapper to handle raw SQL results and prevent summarization
-            _sql_engine = self.sql_engine
-            import html, re, ast
             def sql_query_tool(query: str) -> str:
                 """Esegue query sul database del museo. Restituisce il testo integrale trovato."""
                 try:
                     # 1. ARCHITECTURAL GUARDRAILS
                     # Ensure the generated SQL is safe and stays within authorized tables
                     allowed = list(self.db_intel.get("tables", {}).keys())
-                    SQLGuardrails.validate_sql(query, allowed)
+                    tables = SQLGuardrails.validate_sql(query, allowed)
 
                     # Retrieve the site_id for the CURRENT execution context
-                    current_site_id = ctx_site_id.get() or getattr(self, "_last_site_id", None)
+                    current_site_id = ctx_site_id.get()
                     if current_site_id:
-                        query_up = query.upper()
-                        from sqlalchemy import inspect
-                        inspector = inspect(self.sql_database.engine)
-                        # Extract all tables mentioned in the query (handles schema.table or just table)
-                        matches = re.findall(r"(?:FROM|JOIN)\s+([a-zA-Z0-9_\.]+)", query_up)
-                        for full_table in matches:
-                            parts = full_table.split(".")
-                            table_name = parts[-1].lower()
-                            schema_name = parts[0].lower() if len(parts) > 1 else "guide"
-                            try:
-                                cols_info = []
-                                try:
-                                    cols_info = inspector.get_columns(table_name, schema=schema_name)
-                                except:
-                                    try:
-                                        cols_info = inspector.get_columns(table_name)
-                                    except:
-                                        pass
-                                
-                                cols = [c['name'].upper() for c in cols_info]
-                                if not cols:
-                                    for sch in inspector.get_schema_names():
-                                        try:
-                                            cols_info = inspector.get_columns(table_name, schema=sch)
-                                            if cols_info: 
-                                                cols = [c['name'].upper() for c in cols_info]
-                                                schema_name = sch
-                                                break
-                                        except: continue
-                                
-                                if "SITEID" in cols and "SITEID" not in query_up:
-                                    return (
-                                        f"ERRORE DI SICUREZZA: La tabella '{table_name}' possiede la colonna 'siteid' ma il filtro manca nella query SQL. "
-                                        f"DEVI aggiungere 'siteid = {current_site_id}' nella clausola WHERE (o nel JOIN)."
-                                    )
-                            except Exception:
-                                pass
-
-                    # 3. EXECUTION
-                    result = _sql_engine.query(query)
+                        # Tables come from the guardrails scan: siteid-bearing ones need 'siteid = <site>'
+                        table_name = SQLGuardrails.missing_site_filter(query, tables, self._siteid_tables, current_site_id)
+                        if table_name:
+                            return (
+                                f"ERRORE DI SICUREZZA: La tabella '{table_name}' possiede la colonna 'siteid' ma il filtro manca nella query SQL. "
+                                f"DEVI aggiungere 'siteid = {current_site_id}' nella clausola WHERE (o nel JOIN)."
+                            )
+
+                    # 3. EXECUTION (cached per statement and site). The key is the full SQL with
+                    # whitespace collapsed: case is kept, literals like 'Rossi'/'ROSSI' differ
+                    cache_key = (hashlib.sha256(" ".join(query.split()).encode()).digest(), current_site_id)
+                    result = self._sql_results.get(cache_key)
+                    if result is None:
+                        # Validated SELECT: run it as is, rows keep their native types
+                        # (text() as SQLDatabase.run_sql does: '%' needs no driver escaping)
+                        with self.sql_database.engine.connect() as conn:
+                            result = [tuple(r) for r in conn.execute(text(query)).fetchmany(SQL_ROW_LIMIT)]
+                        self._sql_results.set(cache_key, result)
+                    else:
+                        logger.debug("SQL result cache hit")
                 except Exception as e:
                     # SELF-CORRECTION LOOP:
                     # Instead of crashing, return the error to the LLM so it can fix the query
@@ -284,48 +354,23 @@ class TenantQueryPipeline:
                         "NON SCUSARTI, NON MENZIONARE L'ERRORE ALL'UTENTE. "
                         "Esegui solo la correzione in modo invisibile."
                     )
-                raw = str(result)
                 
-                # Try to parse the raw string [('text',), ...] to extract pure text
-                max_field_len = 0
-                # Attempt robust parsing of SQL results (tuples/lists)
+                # Rows arrive as native tuples (dates, Decimals included): no string round trip
                 rows = []
-                try:
-                    # Clean up common SQL string artifacts before eval
-                    raw_eval = raw.replace('datetime.date', 'str').replace('Decimal', 'float')
-                    parsed = ast.literal_eval(raw_eval)
-                    if isinstance(parsed, list):
-                        for row in parsed:
-                            if isinstance(row, (list, tuple)):
-                                # Extract long fields for bypass detection
-                                for col in row:
-                                    if isinstance(col, str):
-                                        max_field_len = max(max_field_len, len(col))
-                                row_str = " - ".join([str(c) for c in row if c is not None and str(c).strip() != ""])
-                                if row_str and row_str not in rows: 
-                                    rows.append(row_str)
-                            else:
-                                rows.append(str(row))
-                        raw = "\n\n".join(rows)
-                except (ValueError, SyntaxError, Exception) as e:
-                    # FALLBACK: If literal_eval fails, use regex to extract text
-                    print(f"[SQL PARSING WARN] {str(e)} - Falling back to regex.")
-                    # Keep alphanumeric, common punctuation, and spaces
-                    # Remove list/tuple brackets and quotes
-                    cleaned = re.sub(r"[\[\]\(\)\"']", " ", raw)
-                    # Normalize whitespace
-                    cleaned = re.sub(r"\s+", " ", cleaned).strip()
-                    # Remove artifacts like 'datetime.date' or 'Decimal' that might remain
-                    cleaned = re.sub(r"(datetime\.date|Decimal)", "", cleaned)
-                    rows.append(cleaned)
-                    raw = "\n\n".join(rows)
+                seen = set()  # order-preserving dedup in O(1) per row
+                for row in result:
+                    row_str = " - ".join([cell for cell in (str(c) for c in row if c is not None) if cell.strip()])
+                    if row_str and row_str not in seen:
+                        seen.add(row_str)
+                        rows.append(row_str)
+                raw = "\n\n".join(rows)
                 
                 # Global HTML/Tag cleaning
                 raw = html.unescape(raw)
-                raw = re.sub(r'<(p|br|div)[^>]*>', '\n', raw, flags=re.IGNORECASE)
-                raw = re.sub(r'<[^>]+>', ' ', raw)
-                raw = re.sub(r' +', ' ', raw)
-                raw = re.sub(r'\n\s*\n', '\n\n', raw)
+                raw = _TAG_BLOCK_RE.sub('\n', raw)
+                raw = _TAG_ANY_RE.sub(' ', raw)
+                raw = _MULTI_SPACE_RE.sub(' ', raw)
+                raw = _DBL_NL_RE.sub('\n\n', raw)
                 raw = raw.strip()
                 
                 if not raw or raw == "[]":
@@ -341,18 +386,17 @@ class TenantQueryPipeline:
                 Parametri facoltativi: title, artist, category, room, technique. 
                 Usa questo SOLO per trovare l'ID dell'opera o per elenchi. 
                 Se l'utente vuole INFO su un'opera specifica, devi chiamare ANCHE 'get_artwork_details'."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1))
+                site_id = int(ctx_site_id.get() or 1)
                 results = self.broker.list_opere(site_id, title, artist, category, room, technique, general_query)
                 if not results: return "Nessuna opera trovata."
-                return json.dumps(results, indent=2)
+                return _tool_json(results)
 
             def get_artwork_details_tool(artwork_id: int) -> str:
                 """Recupera l'intera riga dei dati tecnici e la descrizione (campo 'artistworktargetdescription') di un'opera dal suo artistworkid."""
                 try:
                     lang = ctx_language_id.get() or "it"
                     target = ctx_audience_target.get() or "STD"
-                    raw_site = ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1
-                    current_site_id = int(raw_site)
+                    current_site_id = int(ctx_site_id.get() or 1)
                     
                     result = self.broker.get_opera_details(current_site_id, artwork_id, lang, target)
                     if not result: 
@@ -362,69 +406,88 @@ class TenantQueryPipeline:
                     result.pop("_INTERNAL_NOTICE_", None)
                     
                     # Update session focus
-                    session_id = getattr(self, "_current_session_id", "default")
-                    focus = self.session_focus.get(session_id, {})
-                    focus.update({"artwork_id": artwork_id, "artwork_title": result.get("artistworktitle")})
-                    self.session_focus[session_id] = focus
+                    session_id = ctx_session_id.get()
+                    self.session_focus.setdefault(session_id, {}).update(
+                        artwork_id=artwork_id, artwork_title=result.get("artistworktitle"))
                     
-                    return json.dumps(result, ensure_ascii=False, indent=2)
+                    return _tool_json(result)
                 except Exception as e:
-                    import traceback
                     traceback.print_exc()
                     return f"Errore nel recupero dettagli opera: {e}"
 
+            def get_artworks_details_bulk_tool(artwork_ids: List[int]) -> str:
+                """Recupera in un'unica chiamata i dettagli di PIÙ opere dai loro artistworkid.
+                Usalo al posto di chiamate ripetute a 'get_artwork_details' quando hai già 2 o più ID."""
+                try:
+                    lang = ctx_language_id.get() or "it"
+                    target = ctx_audience_target.get() or "STD"
+                    site_id = int(ctx_site_id.get() or 1)
+                    
+                    details = self.broker.get_opera_details_many(site_id, artwork_ids, lang, target)
+                    results = []
+                    for artwork_id in dict.fromkeys(artwork_ids):
+                        result = details.get(artwork_id)
+                        if result:
+                            result.pop("_INTERNAL_NOTICE_", None)
+                            results.append(result)
+                    if not results:
+                        return "Dettagli non disponibili per queste opere."
+                    return _tool_json(results)
+                except Exception as e:
+                    traceback.print_exc()
+                    return f"Errore nel recupero dettagli opere: {e}"
+
             def search_artists_tool(name: Optional[str] = None, category: Optional[str] = None) -> str:
                 """Trova artisti (tabella 'artist'). Filtri: name, category.
                 ATTENZIONE: questo tool restituisce solo l'ID e il nome. 
                 Per rispondere all'utente su un artista specifico, devi chiamare ANCHE 'get_artist_details' con l'artistid ottenuto.
                 Non rispondere all'utente senza aver prima chiamato get_artist_details."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
+                site_id = int(ctx_site_id.get() or 1)
                 lang = ctx_language_id.get() or "it"
                 results = self.broker.list_artisti(site_id, name, category, lang)
                 if not results: return "Nessun artista trovato."
-                return json.dumps(results, indent=2)
+                return _tool_json(results)
 
             def get_artist_details_tool(artist_id: int) -> str:
                 """Recupera biografia COMPLETA e dettagli tramite artistid.
                 OBBLIGATORIO: chiamalo SEMPRE dopo search_artists se l'utente chiede info su un artista.
                 Non fermarti a search_artists: senza get_artist_details la risposta è parziale e sbagliata."""
+                return _artist_details(artist_id)
+
+            def _artist_details(artist_id: int, conn=None) -> str:
                 lang = ctx_language_id.get()
-                result = self.broker.get_artista_details(artist_id, lang)
+                site_id = int(ctx_site_id.get() or 1)
+                # Details + artworks list (opere) in a single query
+                result = self.broker.get_artista_details_with_opere(site_id, artist_id, lang, conn=conn)
                 if not result:
                     return "Artista non trovato nel database."
-                # Enrich with artworks list
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
-                artworks = self.broker.list_opere(site_id, artist_name=result.get("artistname"))
-                if artworks:
-                    result["opere"] = [
-                        {"titolo": a.get("artistworktitle"), "tecnica": a.get("techniquedescription"), "sala": a.get("roomname")}
-                        for a in artworks
-                    ]
                 
                 # Update session focus
-                session_id = getattr(self, "_current_session_id", "default")
-                focus = self.session_focus.get(session_id, {})
-                focus.update({"artist_id": artist_id, "artist_name": result.get("artistname")})
-                self.session_focus[session_id] = focus
+                session_id = ctx_session_id.get()
+                self.session_focus.setdefault(session_id, {}).update(
+                    artist_id=artist_id, artist_name=result.get("artistname"))
                 
-                return json.dumps(result, ensure_ascii=False, indent=2)
+                return _tool_json(result)
 
             def get_artist_info_tool(name: str) -> str:
                 """Recupera biografia e opere di un artista cercandolo per NOME.
                 Usa questo tool se conosci il nome dell'artista (es. 'Cacciapuoti' o 'Guido Cacciapuoti')."""
                 try:
-                    # Robust fallback for site_id logic
-                    raw_id = ctx_site_id.get() or getattr(self, "_last_site_id", 1)
-                    site_id = int(raw_id) if raw_id is not None else 1
+                    site_id = int(ctx_site_id.get() or 1)
                     lang = ctx_language_id.get() or "it"
                     
-                    matches = self.broker.list_artisti(site_id, name=name, language_id=lang)
-                    if not matches: return f"Nessun artista trovato con il nome '{name}'."
-                    
-                    if len(matches) > 1 and name.lower() not in [m["artistname"].lower() for m in matches]:
-                        return "Ho trovato più artisti con nomi simili: " + ", ".join([m["artistname"] for m in matches])
-                    
-                    return get_artist_details_tool(matches[0]["artistid"])
+                    # Name lookup + details on one pooled connection
+                    with self.broker.connect() as conn:
+                        matches = self.broker.list_artisti(site_id, name=name, language_id=lang, conn=conn)
+                        if not matches: return f"Nessun artista trovato con il nome '{name}'."
+                        
+                        # Exact name first, whatever its alphabetical position among the matches
+                        name_low = name.lower()
+                        best = next((m for m in matches if m["artistname"].lower() == name_low), None)
+                        if best is None and len(matches) > 1:
+                            return "Ho trovato più artisti con nomi simili: " + ", ".join(m["artistname"] for m in matches)
+                        
+                        return _artist_details((best or matches[0])["artistid"], conn=conn)
                 except Exception as te:
                     print(f"[ERROR] get_artist_info: {te}")
                     return "Si è verificato un errore nel recupero delle informazioni."
@@ -433,13 +496,14 @@ class TenantQueryPipeline:
                 """Recupera i dettagli tecnici e la descrizione di un'opera cercandola per TITOLO.
                 Usa questo tool se conosci il titolo dell'opera (es. 'Gallo e gallina')."""
                 try:
-                    site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
-                    # 1. Search for IDs
-                    matches = self.broker.list_opere(site_id, title=title)
+                    site_id = int(ctx_site_id.get() or 1)
+                    # 1. Search for IDs (closest titles first, ranked by the DB)
+                    matches = self.broker.find_opere_by_title(site_id, title, limit=5)
                     if not matches: return f"Nessun'opera trovata con il titolo '{title}'."
                     
-                    if len(matches) > 3:
-                         return "Ho trovato molte opere con titoli simili. Potresti essere più specifico? Ecco alcune: " + ", ".join([m["artistworktitle"] for m in matches[:5]])
+                    exact = matches[0]["artistworktitle"].strip().lower() == title.strip().lower()
+                    if len(matches) > 3 and not exact:
+                         return "Ho trovato molte opere con titoli simili. Potresti essere più specifico? Ecco alcune: " + ", ".join(m["artistworktitle"] for m in matches)
                     
                     # Take the best match
                     artwork_id = matches[0]["artistworkid"]
@@ -450,42 +514,40 @@ class TenantQueryPipeline:
 
             def list_locations_tool() -> str:
                 """Elenca tutte le sale ed edifici del museo dove sono presenti opere."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
+                site_id = int(ctx_site_id.get() or 1)
                 results = self.broker.list_locations(site_id)
                 if not results: return "Nessuna sala trovata."
-                return json.dumps(results, indent=2)
+                return _tool_json(results)
 
             def get_location_details_tool(location_id: int) -> str:
                 """Recupera la descrizione e i dati di una sala (tabella 'room' / 'location') tramite locationid."""
                 lang = ctx_language_id.get()
                 result = self.broker.get_location_details(location_id, lang)
                 if not result: return "Dettagli non disponibili per questa sala."
-                return json.dumps(result, indent=2)
+                return _tool_json(result)
 
             def get_pathway_info_tool(pathway_name: Optional[str] = None, pathway_id: Optional[int] = None) -> str:
                 """Recupera la descrizione e la lista delle opere di un percorso tematico.
                 - pathway_name: il nome del percorso (es. 'MODA', 'ANIMALI')
                 - pathway_id: l'ID numerico del percorso (se noto)
                 """
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1))
+                site_id = int(ctx_site_id.get() or 1)
                 lang = ctx_language_id.get()
                 
                 pid = pathway_id
-                if not pid and pathway_name:
-                    # Cerca l'ID dal nome
-                    pathways = self.broker.list_pathways(site_id)
-                    for p in pathways:
-                        if pathway_name.upper() in p["pathwayname"].upper():
-                            pid = p["pathwayid"]
-                            break
-                
-                if not pid:
-                    return f"Non ho trovato il percorso '{pathway_name or pathway_id}'."
-                
-                # Prendi dettagli
-                details = self.broker.get_pathway_details(pid, lang)
-                # Prendi opere
-                artworks = self.broker.get_percorso_opere(site_id, details.get("pathwayname", pathway_name))
+                # Lookup, details and artworks on one pooled connection
+                with self.broker.connect() as conn:
+                    if not pid and pathway_name:
+                        # Cerca l'ID dal nome
+                        pid = self.broker.find_pathway_id(site_id, pathway_name, conn=conn)
+
+                    if not pid:
+                        return f"Non ho trovato il percorso '{pathway_name or pathway_id}'."
+
+                    # Prendi dettagli
+                    details = self.broker.get_pathway_details(pid, lang, conn=conn)
+                    # Prendi opere
+                    artworks = self.broker.get_percorso_opere(site_id, details.get("pathwayname", pathway_name), conn=conn)
                 
                 result = {
                     "pathway_name": details.get("pathwayname"),
@@ -493,73 +555,76 @@ class TenantQueryPipeline:
                     "artworks": artworks
                 }
                 
-                return json.dumps(result, ensure_ascii=False, indent=2)
+                return _tool_json(result)
 
             def list_pathways_tool() -> str:
                 """Elenca tutti i percorsi tematici disponibili nel museo."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
+                site_id = int(ctx_site_id.get() or 1)
                 results = self.broker.list_pathways(site_id)
                 if not results: return "Nessun percorso trovato."
-                return json.dumps(results, indent=2)
+                return _tool_json(results)
 
             def list_categories_tool() -> str:
                 """Elenca le categorie disponibili (es. Pittura, Scultura). 
                 ATTENZIONE: Se l'utente chiede una LISTA di opere ('mostrami i dipinti'), NON usare questo strumento, usa search_artworks(category='PITTORI'). 
                 Usa questo solo se l'utente chiede esplicitamente 'Quali categorie ci sono?'."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
+                site_id = int(ctx_site_id.get() or 1)
                 results = self.broker.list_categories(site_id)
                 if not results: return "Nessuna categoria trovata."
                 return ", ".join(results)
 
             def list_techniques_tool() -> str:
                 """Elenca le tecniche e i materiali delle opere presenti (es. Olio su tela, Marmo)."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
+                site_id = int(ctx_site_id.get() or 1)
                 results = self.broker.list_techniques(site_id)
                 if not results: return "Nessuna tecnica trovata."
                 return ", ".join(results)
 
             def get_museum_info_tool() -> str:
                 """Recupera la storia, l'architettura e i contatti generali del museo."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1) or 1)
-                result = self.broker.get_museum_info(site_id) or {}
+                site_id = int(ctx_site_id.get() or 1)
+                result = dict(self.broker.get_museum_info(site_id))
                 # Force fallback if fields are empty, None or missing
                 if not result.get("history") or len(str(result.get("history"))) < 10:
                     result["history"] = "Il Museo Luigi Bailo è la sede storica della galleria d'arte moderna di Treviso. Fondato nel 1879 dall'Abate Luigi Bailo, è stato riaperto nel 2015 con un restyling che fonde il chiostro antico con una galleria moderna in vetro e cemento."
                 if not result.get("architecture"):
                     result["architecture"] = "L'architettura attuale è un dialogo tra l'ex convento rinascimentale e la nuova facciata minimalista, che funge da 'lanterna' urbana."
-                return json.dumps(result, indent=2)
+                return _tool_json(result)
 
             def list_related_artworks_tool(room_id: int) -> str:
                 """Elenca altre opere presenti nella stessa sala (cross-selling/approfondimento)."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1))
+                site_id = int(ctx_site_id.get() or 1)
                 results = self.broker.list_artworks_in_room(site_id, room_id)
                 if not results: return "Nessuna opera correlata trovata."
-                return json.dumps(results, indent=2)
+                return _tool_json(results)
 
             def search_by_inventory_tool(inventory_number: str) -> str:
                 """Trova un'opera specifica partendo dal suo numero di inventario (es. MCA 123)."""
-                site_id = int(ctx_site_id.get() or getattr(self, "_last_site_id", 1))
+                site_id = int(ctx_site_id.get() or 1)
                 results = self.broker.search_by_inventory(site_id, inventory_number)
                 if not results: return f"Nessun'opera trovata con inventario {inventory_number}."
-                return json.dumps(results, indent=2)
-
-            self.query_tools.extend([
-                FunctionTool.from_defaults(fn=get_artist_info_tool, name="get_artist_info"),
-                FunctionTool.from_defaults(fn=get_artwork_info_tool, name="get_artwork_info"),
-                FunctionTool.from_defaults(fn=search_artworks_tool, name="search_artworks"),
-                FunctionTool.from_defaults(fn=get_artwork_details_tool, name="get_artwork_details"),
-                FunctionTool.from_defaults(fn=search_artists_tool, name="search_artists"),
-                FunctionTool.from_defaults(fn=get_artist_details_tool, name="get_artist_details"),
-                FunctionTool.from_defaults(fn=list_locations_tool, name="list_locations"),
-                FunctionTool.from_defaults(fn=get_location_details_tool, name="get_location_details"),
-                FunctionTool.from_defaults(fn=get_pathway_info_tool, name="get_pathway_info"),
-                FunctionTool.from_defaults(fn=list_pathways_tool, name="list_pathways"),
-                FunctionTool.from_defaults(fn=list_categories_tool, name="list_categories"),
-                FunctionTool.from_defaults(fn=list_techniques_tool, name="list_techniques"),
-                FunctionTool.from_defaults(fn=get_museum_info_tool, name="get_museum_info"),
-                FunctionTool.from_defaults(fn=list_related_artworks_tool, name="list_related_artworks"),
-                FunctionTool.from_defaults(fn=search_by_inventory_tool, name="search_by_inventory")
-            ])
+                return _tool_json(results)
+
+            # Atomic tools, in the order the agent sees them
+            atomic_tools = [
+                ("get_artist_info", get_artist_info_tool),
+                ("get_artwork_info", get_artwork_info_tool),
+                ("search_artworks", search_artworks_tool),
+                ("get_artwork_details", get_artwork_details_tool),
+                ("get_artworks_details_bulk", get_artworks_details_bulk_tool),
+                ("search_artists", search_artists_tool),
+                ("get_artist_details", get_artist_details_tool),
+                ("list_locations", list_locations_tool),
+                ("get_location_details", get_location_details_tool),
+                ("get_pathway_info", get_pathway_info_tool),
+                ("list_pathways", list_pathways_tool),
+                ("list_categories", list_categories_tool),
+                ("list_techniques", list_techniques_tool),
+                ("get_museum_info", get_museum_info_tool),
+                ("list_related_artworks", list_related_artworks_tool),
+                ("search_by_inventory", search_by_inventory_tool),
+            ]
+            self.query_tools.extend(FunctionTool.from_defaults(fn=fn, name=name) for name, fn in atomic_tools)
 
             sql_tool = FunctionTool.from_defaults(
                 fn=sql_query_tool,
@@ -573,7 +638,6 @@ class TenantQueryPipeline:
 
         # 5. RAG Engine
         if doc_store_path and os.path.exists(doc_store_path):
-            from llama_index.core import StorageContext, load_index_from_storage
             try:
                 storage_context = StorageContext.from_defaults(persist_dir=doc_store_path)
                 vector_index = load_index_from_storage(storage_context, embed_model=self.embed_model)
@@ -585,11 +649,13 @@ class TenantQueryPipeline:
                 ))
             except Exception: pass
 
-        # 6. Create Agent (FunctionAgent uses native function calling — no ReAct text traces)
+        # 6. Create Agent (FunctionAgent uses native function calling — no ReAct text traces).
+        # ReAct only for models without function calling (FunctionAgent would reject them at run time)
         try:
             print(f"--- Creating Agent (Tools count: {len(self.query_tools)}) ---")
             
-            self.agent = FunctionAgent(
+            agent_cls = FunctionAgent if self.llm.metadata.is_function_calling_model else ReActAgent
+            self.agent = agent_cls(
                 tools=self.query_tools, 
                 llm=self.llm, 
                 system_prompt=self.context_to_inject,
@@ -597,16 +663,92 @@ class TenantQueryPipeline:
             )
             print("--- Agent Created successfully ---")
             
-            # 7. Initialize session-specific SQL bypass and state
-            self._sql_bypass: Dict[str, Optional[str]] = {}
-            self._last_site_id: int = 1
-            
         except Exception as e:
             print(f"[ERROR] Agent Creation failed: {e}")
-            import traceback
             traceback.print_exc()
             raise e
 
+    def invalidate_catalogue_caches(self):
+        """Drop cached reference data, SQL results and answers (call after curators edit the catalogue)."""
+        broker = getattr(self, "broker", None)
+        if broker is not None:
+            broker.invalidate_reference_cache()
+        self._sql_results.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+
+    def _session_history(self, session_id: str) -> deque:
+        """Bounded history of a session; creating one may evict the least recently active."""
+        history = self.session_memory.get(session_id)
+        if history is not None:
+            self.session_memory.move_to_end(session_id)
+            return history
+        history = deque(maxlen=SESSION_HISTORY_LEN)
+        self.session_memory[session_id] = history
+        while len(self.session_memory) > MAX_SESSIONS:
+            idle_id, _ = self.session_memory.popitem(last=False)
+            self.session_focus.pop(idle_id, None)
+            self._sql_bypass.pop(idle_id, None)
+        return history
+
+    def _prepare_run(self, history: deque, session_id: str, site_id: Optional[str], target: Optional[str], detected_lang: str):
+        """
+        Sets the tool context and builds the chat history for the agent
+        (session history + execution context + conversation focus).
+        Returns (chat_history, tokens); tokens go back to _reset_context.
+        """
+        tokens = (
+            ctx_site_id.set(site_id),
+            ctx_audience_target.set(target or "STD"),
+            ctx_language_id.set(detected_lang),
+            ctx_session_id.set(session_id),
+        )
+
+        current_context = []
+        if site_id or target:
+            parts = []
+            if site_id: parts.append(f"siteid={site_id}")
+            if target: parts.append(f"target_pubblico={target}")
+            current_context.append(ChatMessage(
+                role=MessageRole.SYSTEM,
+                content=f"CONTESTO ESECUTIVO: {', '.join(parts)}. Usa gli strumenti atomici (search_artworks, get_artwork_details, etc.) per rispondere. Gli strumenti filtrano automaticamente per siteid e target di pubblico."
+            ))
+
+        # Session focus, for follow-up questions
+        focus = self.session_focus.get(session_id, {})
+        focus_str = ""
+        if focus.get("artist_name"): focus_str += f"- Artist Focus: {focus['artist_name']} (ID: {focus['artist_id']})\n"
+        if focus.get("artwork_title"): focus_str += f"- Artwork Focus: {focus['artwork_title']} (ID: {focus['artwork_id']})\n"
+
+        if focus_str:
+            current_context.append(ChatMessage(
+                role=MessageRole.SYSTEM,
+                content=f"FOCUS CORRENTE DELLA CONVERSAZIONE:\n{focus_str}\nUsa queste informazioni se l'utente fa domande di follow-up (es. 'dove è nato?', 'mostrami le sue opere')."
+            ))
+
+        return [*history, *current_context], tokens
+
+    @staticmethod
+    def _finish_run(history: deque, user_query: str, answer: str) -> None:
+        """Stores the turn (the deque keeps only the last SESSION_HISTORY_LEN messages,
+        to stay within TPM limits)."""
+        history.extend((
+            ChatMessage(role=MessageRole.USER, content=user_query),
+            ChatMessage(role=MessageRole.ASSISTANT, content=answer),
+        ))
+
+    @staticmethod
+    def _reset_context(tokens) -> None:
+        """Restores the tool context vars set by _prepare_run (also after a failed run)."""
+        token_site, token_target, token_lang, token_session = tokens
+        # A stream abandoned by the client may be finalized from another context:
+        # its tokens can't be reset there, and that context never saw the values anyway
+        with contextlib.suppress(ValueError):
+            ctx_site_id.reset(token_site)
+            ctx_audience_target.reset(token_target)
+            ctx_language_id.reset(token_lang)
+            ctx_session_id.reset(token_session)
+
     def _sanitize_response(self, answer: str, technical_only: bool = False) -> str:
         """Remove leaked technical artifacts from the response.
         
@@ -614,97 +756,64 @@ class TenantQueryPipeline:
         is already the user-facing answer. This method only needs to clean up
         data-level leaks (siteid, SQL errors, internal IDs) not agent-level ones.
         """
-        # Remove internal tokens
-        answer = answer.replace('[[DIRECT_DISPLAY]]', '')
-        
-        # Remove siteid references that tools might have leaked into their output
-        answer = re.sub(r'\[siteid=\d+\]', '', answer)
-        answer = re.sub(r'\(FILTRO OBBLIGATORIO[^)]*\)', '', answer)
-        answer = re.sub(r'\bsiteid\s*=\s*\d+', '', answer, flags=re.IGNORECASE)
-        
-        # Remove code fences with SQL (from tool error messages fed back to agent)
-        answer = re.sub(r'```sql\s*.*?```', '', answer, flags=re.DOTALL)
-        
+        # Substring probe first: most answers contain no leak token at all
+        answer_low = answer.lower()
+        has_leaks = any(tok in answer_low for tok in _LEAK_TOKENS)
+
+        # Internal tokens, siteid references and SQL code fences (from tool error
+        # messages fed back to the agent)
         if technical_only:
-            return answer.strip()
+            return (_TECHNICAL_LEAKS_RE.sub('', answer) if has_leaks else answer).strip()
 
         # Replace raw DB exceptions with a user-friendly message
         if "sqlalchemy.exc" in answer or "psycopg2" in answer:
             return "Mi dispiace, ho riscontrato un problema tecnico nell'accesso ai dati. Posso provare a cercare in un altro modo?"
         
-        # Remove internal IDs and technical field names
-        answer = re.sub(r'\b(artistid|artistworkid|siteid|roomid|locationid)[:\s=]+\d+\b', '', answer, flags=re.IGNORECASE)
-        answer = re.sub(r'\b(inventorynumber|imageref|artist_alias)[:\s=]+', '', answer, flags=re.IGNORECASE)
+        # Same pass also removes internal IDs and technical field names
+        if has_leaks:
+            answer = _ALL_LEAKS_RE.sub('', answer)
         
         # Clean up excessive whitespace
-        answer = re.sub(r'\n{3,}', '\n\n', answer)
+        answer = _EXCESS_NL_RE.sub('\n\n', answer)
         return answer.strip()
 
-    async def query(self, user_query: str, session_id: str, site_id: str = None, target: str = None):
+    async def query(self, user_query: str, session_id: str, site_id: str = None, target: str = None, no_cache: bool = False):
         start_time = time.time()
         if not self.query_tools:
             return {"answer": "Nessuna fonte dati configurata.", "source_type": "none"}
             
-        print(f"[PROCESS] Session: {session_id} | Query: {user_query}")
-        self._current_session_id = session_id
+        logger.debug("[PROCESS] Session: %s | Query: %s", session_id, user_query)
         
+        tokens = None
         try:
-            if session_id not in self.session_memory:
-                self.session_memory[session_id] = []
-            history = self.session_memory[session_id]
-            
-            # Simple language detection
-            detected_lang = "it"
-            q_low = user_query.lower()
-            if any(w in q_low for w in ["english", "what is", "tell me", "where is", "who was", "describe", "show me"]): detected_lang = "en"
-            elif any(w in q_low for w in ["français", "qu'est-ce", "raconte-moi", "où est", "décris"]): detected_lang = "fr"
-            elif any(w in q_low for w in ["español", "qué es", "cuéntame", "donde está", "describe"]): detected_lang = "es"
-
-            # Set context for tools
-            token_site = ctx_site_id.set(site_id)
-            token_target = ctx_audience_target.set(target or "STD")
-            token_lang = ctx_language_id.set(detected_lang) 
-            
-            # Ensure site_id is an integer for the fallback
-            try:
-                self._last_site_id = int(site_id) if site_id is not None else 1
-            except:
-                self._last_site_id = 1
-            self._last_target = target
+            history = self._session_history(session_id)
             
-            # Clean query
-            enriched_query = user_query
-            
-            current_context = []
-            if site_id or target:
-                parts = []
-                if site_id: parts.append(f"siteid={site_id}")
-                if target: parts.append(f"target_pubblico={target}")
-                hint = ChatMessage(
-                    role=MessageRole.SYSTEM, 
-                    content=f"CONTESTO ESECUTIVO: {', '.join(parts)}. Usa gli strumenti atomici (search_artworks, get_artwork_details, etc.) per rispondere. Gli strumenti filtrano automaticamente per siteid e target di pubblico."
-                )
-                current_context.append(hint)
+            detected_lang = _detect_lang(user_query)
 
-            # 4. Initialize local memory for this session
-            from llama_index.core.memory import ChatMemoryBuffer
-            memory = ChatMemoryBuffer.from_defaults(chat_history=history, token_limit=4000)
-            
-            # 4b. Inject Session Focus into temporary context
-            focus = self.session_focus.get(session_id, {})
-            focus_str = ""
-            if focus.get("artist_name"): focus_str += f"- Artist Focus: {focus['artist_name']} (ID: {focus['artist_id']})\n"
-            if focus.get("artwork_title"): focus_str += f"- Artwork Focus: {focus['artwork_title']} (ID: {focus['artwork_id']})\n"
-            
-            if focus_str:
-                current_context.append(ChatMessage(
-                    role=MessageRole.SYSTEM,
-                    content=f"FOCUS CORRENTE DELLA CONVERSAZIONE:\n{focus_str}\nUsa queste informazioni se l'utente fa domande di follow-up (es. 'dove è nato?', 'mostrami le sue opere')."
-                ))
+            # Semantic cache: only for standalone questions (a follow-up depends on the history)
+            cache_ns, query_emb = None, None
+            if self.semantic_cache is not None and not no_cache and not history:
+                cache_ns = f"{site_id}|{target or 'STD'}|{detected_lang}"
+                cached_answer = None
+                try:
+                    query_emb = await self.embed_model.aget_query_embedding(user_query)
+                    # SQLite read + cosine scan: off the event loop
+                    cached_answer = await asyncio.to_thread(self.semantic_cache.lookup, cache_ns, query_emb)
+                except Exception as e:
+                    logger.warning("Semantic cache lookup failed: %s", e)
+                    query_emb = None
+                if cached_answer is not None:
+                    logger.debug("[CACHE] Semantic hit for session %s", session_id)
+                    history.extend((
+                        ChatMessage(role=MessageRole.USER, content=user_query),
+                        ChatMessage(role=MessageRole.ASSISTANT, content=cached_answer),
+                    ))
+                    return {"answer": cached_answer, "source_type": "cache"}
+
+            full_chat_history, tokens = self._prepare_run(history, session_id, site_id, target, detected_lang)
 
             # 5. Get Agent Response
             agent_start = time.time()
-            full_chat_history = history + current_context
             handler = self.agent.run(user_msg=user_query, chat_history=full_chat_history)
             agent_output = await handler
             
@@ -716,25 +825,20 @@ class TenantQueryPipeline:
             if not answer:
                 answer = str(agent_output)
             
-            # Update memory
-            memory.put(ChatMessage(role=MessageRole.USER, content=user_query))
-            memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+            self._finish_run(history, user_query, answer)
 
             # Clean up any data-level leaks (siteid, SQL errors, internal IDs)
             answer = self._sanitize_response(answer)
 
-            # Save the full updated history (including tool calls/results) from the memory buffer
-            # Optimized: Keep only last 10 messages to stay within TPM limits
-            self.session_memory[session_id] = memory.get_all()[-10:]
+            if query_emb is not None:
+                # The answer is already computed: a cache write failure must not replace it
+                try:
+                    await asyncio.to_thread(self.semantic_cache.store, cache_ns, query_emb, answer)
+                except Exception as e:
+                    logger.warning("Semantic cache store failed: %s", e)
 
-            print(f"[LATENCY] Agent loop: {time.time() - agent_start:.2f}s")
-            print(f"[LATENCY] Total query: {time.time() - start_time:.2f}s")
-            # Always reset context
-            self._current_session_id = None
-            # Always reset context
-            ctx_site_id.reset(token_site)
-            ctx_audience_target.reset(token_target)
-            ctx_language_id.reset(token_lang)
+            end_time = time.time()
+            logger.debug("[LATENCY] Agent loop: %.2fs | Total query: %.2fs", end_time - agent_start, end_time - start_time)
             return {"answer": answer, "source_type": "hybrid"}
         except Exception as e:
             err_msg = str(e)
@@ -747,6 +851,10 @@ class TenantQueryPipeline:
                  friendly_answer = "Mi scuso, ho riscontrato un problema imprevisto nel generare la risposta. Puoi provare a riformulare leggermente la domanda?"
             
             return {"answer": friendly_answer, "source_type": "error"}
+        finally:
+            # Always reset context, or the next request on this task inherits it
+            if tokens is not None:
+                self._reset_context(tokens)
 
     async def astream_query(self, user_query: str, session_id: str, site_id: str = None, target: str = None):
         """Asynchronous streaming version of the query method."""
@@ -754,56 +862,28 @@ class TenantQueryPipeline:
             yield "Nessuna fonte dati configurata."
             return
 
-        print(f"[PROCESS] Stream Session: {session_id} | Query: {user_query}")
+        logger.debug("[PROCESS] Stream Session: %s | Query: %s", session_id, user_query)
         
+        tokens = None
         try:
-            if session_id not in self.session_memory:
-                self.session_memory[session_id] = []
-            history = self.session_memory[session_id]
-            
-            # Simple language detection
-            detected_lang = "it"
-            q_low = user_query.lower()
-            if any(w in q_low for w in ["english", "what is", "tell me", "where is", "who was", "describe", "show me"]): detected_lang = "en"
-            elif any(w in q_low for w in ["français", "qu'est-ce", "raconte-moi", "où est", "décris"]): detected_lang = "fr"
-            elif any(w in q_low for w in ["español", "qué es", "cuéntame", "donde está", "describe"]): detected_lang = "es"
-
-            # Set context
-            token_site = ctx_site_id.set(site_id)
-            token_target = ctx_audience_target.set(target or "STD")
-            token_lang = ctx_language_id.set(detected_lang)
+            history = self._session_history(session_id)
             
-            self._last_site_id = site_id
-            self._last_target = target
-            
-            current_context = []
-            if site_id or target:
-                parts = []
-                if site_id: parts.append(f"siteid={site_id}")
-                if target: parts.append(f"target_pubblico={target}")
-                hint = ChatMessage(
-                    role=MessageRole.SYSTEM, 
-                    content=f"CONTESTO ESECUTIVO: {', '.join(parts)}. Usa gli strumenti atomici filtra automaticamente per siteid e target."
-                )
-                current_context.append(hint)
+            detected_lang = _detect_lang(user_query)
+
+            full_chat_history, tokens = self._prepare_run(history, session_id, site_id, target, detected_lang)
 
-            # 4. Initialize local memory
-            from llama_index.core.memory import ChatMemoryBuffer
-            memory = ChatMemoryBuffer.from_defaults(chat_history=history, token_limit=4000)
-            
             # 5. Get Stream Response via Workflow events
-            agent_start = time.time()
-            full_chat_history = history + current_context
-            
             # Start the run
             handler = self.agent.run(user_msg=user_query, chat_history=full_chat_history)
             
-            full_response = ""
+            # Deltas are joined once at the end (no quadratic string concatenation)
+            chunks = []
             async for event in handler.stream_events():
                 delta = getattr(event, "delta", None)
                 if delta:
-                    full_response += delta
+                    chunks.append(delta)
                     yield delta
+            full_response = "".join(chunks)
             
             # Ensure the workflow actually finished and get final output
             output = await handler 
@@ -821,13 +901,7 @@ class TenantQueryPipeline:
                 full_response = self._sanitize_response(full_response)
                 yield full_response
 
-            # Update memory for stream
-            memory.put(ChatMessage(role=MessageRole.USER, content=user_query))
-            memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=full_response))
-            self.session_memory[session_id] = memory.get_all()[-10:]
-            ctx_site_id.reset(token_site)
-            ctx_audience_target.reset(token_target)
-            ctx_language_id.reset(token_lang)
+            self._finish_run(history, user_query, full_response)
 
         except Exception as e:
             err_msg = str(e)
@@ -838,3 +912,6 @@ class TenantQueryPipeline:
                 yield "Siamo spiacenti, il sistema è temporaneamente sovraccarico. Per favore, attendi qualche secondo e riprova."
             else:
                 yield "Mi scuso, si è verificato un problema nel caricamento della risposta. Per favore, riprova tra un istante."
+        finally:
+            if tokens is not None:
+                self._reset_context(tokens)
@@ -0,0 +1,90 @@
+"""
+Semantic answer cache in front of the agent.
+A question close enough to one already answered (cosine similarity of the
+query embeddings above the threshold) gets the stored answer back without
+running the agent. One SQLite file per tenant; entries are namespaced by
+site/target/language and expire after `ttl` seconds.
+Vectors are stored as int8 with a per-vector scale (4x smaller than float32);
+at the 0.95 threshold the quantization error doesn't change which entry matches.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+SEMANTIC_CACHE_TTL = 3600
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+
+class SemanticCache:
+    def __init__(self, path: str, ttl: float = SEMANTIC_CACHE_TTL, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.threshold = threshold
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Entries of the float32 layout are just dropped: it's a cache
+        self._conn.execute("DROP TABLE IF EXISTS cache")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_q8 ("
+            " namespace TEXT NOT NULL, query_emb BLOB NOT NULL, scale REAL NOT NULL,"
+            " answer TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_q8_ns_ts ON cache_q8 (namespace, ts)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vec: List[float]) -> np.ndarray:
+        arr = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(arr)
+        return arr / norm if norm else arr
+
+    @staticmethod
+    def _quantize(arr: np.ndarray):
+        """Symmetric int8 quantization: arr ~= q * scale."""
+        peak = float(np.max(np.abs(arr))) if arr.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        return np.round(arr / scale).astype(np.int8), scale
+
+    def lookup(self, namespace: str, query_emb: List[float]) -> Optional[str]:
+        """Answer of the most similar live entry, if it clears the threshold."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query_emb, scale, answer FROM cache_q8 WHERE namespace = ? AND ts > ?",
+                (namespace, time.time() - self.ttl),
+            ).fetchall()
+        if not rows:
+            return None
+        q = self._normalize(query_emb)
+        matrix = np.frombuffer(b"".join(r[0] for r in rows), dtype=np.int8).reshape(len(rows), -1)
+        if matrix.shape[1] != q.shape[0]:
+            # Embedding model changed: old vectors aren't comparable
+            return None
+        scales = np.fromiter((r[1] for r in rows), dtype=np.float32, count=len(rows))
+        scores = (matrix.astype(np.float32) @ q) * scales
+        best = int(np.argmax(scores))
+        return rows[best][2] if scores[best] >= self.threshold else None
+
+    def store(self, namespace: str, query_emb: List[float], answer: str) -> None:
+        quantized, scale = self._quantize(self._normalize(query_emb))
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_q8 WHERE ts <= ?", (now - self.ttl,))
+            self._conn.execute(
+                "INSERT INTO cache_q8 (namespace, query_emb, scale, answer, ts) VALUES (?, ?, ?, ?, ?)",
+                (namespace, quantized.tobytes(), scale, answer, now),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_q8")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -5,8 +5,13 @@ from app.api.routes import router as api_router, warmup_pipelines
 from app.api.auth_routes import router as auth_router
 from app.core.config import settings
 import uvicorn
+import logging
 import os
 
+# App loggers (app.*) follow settings.DEBUG; third-party libraries stay at INFO
+logging.basicConfig(level=logging.INFO, format="%(levelname)s [%(name)s] %(message)s")
+logging.getLogger("app").setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+
 app = FastAPI(
     title=settings.APP_NAME,
     description="Multi-tenant AI Knowledge Engine with BYO-LLM",
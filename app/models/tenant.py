@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from pydantic import AliasPath, BaseModel, Field, ConfigDict, field_validator, model_validator
+from typing import Optional, List, Literal, Any
 from datetime import datetime
 
 class LLMConfig(BaseModel):
@@ -92,22 +92,42 @@ class TenantUpdateDBRequest(BaseModel):
     timeout_seconds: int = 30
 
 class TenantPublicView(BaseModel):
-    """Safe view of tenant config (no secrets)."""
+    """
+    Safe view of tenant config (no secrets).
+    Build it from a Tenant with TenantPublicView.model_validate(tenant): nested
+    sub-config fields are read through their AliasPath.
+    """
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
     id: str
     name: str
     is_active: bool
-    llm_provider: str
-    llm_model: Optional[str]
-    has_llm_key: bool = False
-    db_enabled: bool
-    db_type: Optional[str]
-    db_host: Optional[str]
-    db_port: Optional[int]
-    db_name: Optional[str]
-    db_user: Optional[str]
-    db_schema: Optional[str] = "public"
-    db_allowed_tables: List[str] = []
-    has_db_password: bool = False
-    docs_enabled: bool
+    llm_provider: str = Field(validation_alias=AliasPath("llm", "provider"))
+    llm_model: Optional[str] = Field(validation_alias=AliasPath("llm", "model_name"))
+    has_llm_key: bool = Field(False, validation_alias=AliasPath("llm", "api_key_encrypted"))
+    db_enabled: bool = Field(validation_alias=AliasPath("database", "enabled"))
+    db_type: Optional[str] = Field(validation_alias=AliasPath("database", "db_type"))
+    db_host: Optional[str] = Field(validation_alias=AliasPath("database", "host"))
+    db_port: Optional[int] = Field(validation_alias=AliasPath("database", "port"))
+    db_name: Optional[str] = Field(validation_alias=AliasPath("database", "database"))
+    db_user: Optional[str] = Field(validation_alias=AliasPath("database", "username"))
+    db_schema: Optional[str] = Field("public", validation_alias=AliasPath("database", "schema_name"))
+    db_allowed_tables: List[str] = Field([], validation_alias=AliasPath("database", "allowed_tables"))
+    has_db_password: bool = Field(False, validation_alias=AliasPath("database", "password_encrypted"))
+    docs_enabled: bool = Field(validation_alias=AliasPath("documents", "enabled"))
     created_at: datetime
 
+    @field_validator("has_llm_key", "has_db_password", mode="before")
+    @classmethod
+    def _is_set(cls, value: Any) -> bool:
+        # Read from the encrypted secret: only whether it's there is exposed
+        return bool(value)
+
+    @model_validator(mode="after")
+    def _hide_disabled_db(self) -> "TenantPublicView":
+        """A disabled database shows no connection details."""
+        if not self.db_enabled:
+            self.db_type = self.db_host = self.db_port = self.db_name = self.db_user = None
+            self.db_schema = "public"
+            self.db_allowed_tables = []
+        return self
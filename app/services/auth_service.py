@@ -23,6 +23,11 @@ JWT_SECRET = settings.JWT_SECRET
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Decode config resolved once at import; verify_token runs on every request
+_JWT_KEY = JWT_SECRET.encode()
+_JWT_ALGS = (JWT_ALGORITHM,)
+_JWT_DECODE_OPTIONS = {"require": ["exp", "sub", "role"], "verify_signature": True}
+
 
 class AuthService:
     """Handles user authentication and JWT management."""
@@ -104,7 +109,7 @@ class AuthService:
             "exp": int(expires.timestamp())
         }
         
-        token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        token = jwt.encode(payload, _JWT_KEY, algorithm=JWT_ALGORITHM)
         
         return Token(
             access_token=token,
@@ -114,7 +119,7 @@ class AuthService:
     def verify_token(self, token: str) -> Optional[TokenPayload]:
         """Decode and validate JWT token."""
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            payload = jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGS, options=_JWT_DECODE_OPTIONS)
             return TokenPayload(**payload)
         except jwt.ExpiredSignatureError:
             return None
@@ -3,12 +3,17 @@ Metering Service - Track usage per tenant for governance and billing plans.
 """
 import json
 import os
+import threading
+from collections import Counter
 from datetime import datetime, date
 from typing import Optional, List
 from pydantic import BaseModel
 
 METERING_STORE_PATH = "./data/metering.json"
 
+def _period(ts: datetime) -> str:
+    return f"{ts.year}-{ts.month:02d}"
+
 class UsageRecord(BaseModel):
     """Single usage record."""
     tenant_id: str
@@ -30,12 +35,25 @@ class TenantUsageSummary(BaseModel):
     successful_queries: int
     failed_queries: int
 
+class CurrentUsage(BaseModel):
+    """Current month's consumption against the tenant's quota."""
+    tenant_id: str
+    queries_used: int
+    queries_limit: int
+    queries_remaining: int
+
 class MeteringService:
     """Tracks and reports usage metrics per tenant."""
     
     def __init__(self):
         self._records: List[UsageRecord] = []
+        # (tenant_id, "YYYY-MM") -> query count, kept in step with _records so
+        # the per-request limit check doesn't scan the whole usage history
+        self._monthly_counts: Counter = Counter()
+        self._lock = threading.Lock()
         self._load_from_disk()
+        for r in self._records:
+            self._monthly_counts[(r.tenant_id, _period(r.timestamp))] += 1
     
     def _load_from_disk(self):
         if os.path.exists(METERING_STORE_PATH):
@@ -68,7 +86,9 @@ class MeteringService:
             estimated_tokens=estimated_tokens,
             success=success
         )
-        self._records.append(record)
+        with self._lock:
+            self._records.append(record)
+            self._monthly_counts[(tenant_id, _period(record.timestamp))] += 1
         self._save_to_disk()
     
     def get_monthly_summary(self, tenant_id: str, year: int, month: int) -> TenantUsageSummary:
@@ -96,13 +116,7 @@ class MeteringService:
     
     def get_current_month_count(self, tenant_id: str) -> int:
         """Get query count for current month (for limit checking)."""
-        now = datetime.utcnow()
-        return sum(
-            1 for r in self._records
-            if r.tenant_id == tenant_id
-            and r.timestamp.year == now.year
-            and r.timestamp.month == now.month
-        )
+        return self._monthly_counts[(tenant_id, _period(datetime.utcnow()))]
     
     def estimate_tokens(self, query: str, response: str) -> int:
         """
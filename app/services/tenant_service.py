@@ -74,28 +74,7 @@ class TenantService:
     
     def list_tenants(self) -> List[TenantPublicView]:
         """List all tenants (safe view, no secrets)."""
-        result = []
-        for t in self._tenants.values():
-            result.append(TenantPublicView(
-                id=t.id,
-                name=t.name,
-                is_active=t.is_active,
-                llm_provider=t.llm.provider,
-                llm_model=t.llm.model_name,
-                has_llm_key=bool(t.llm.api_key_encrypted),
-                db_enabled=t.database.enabled,
-                db_type=t.database.db_type if t.database.enabled else None,
-                db_host=t.database.host if t.database.enabled else None,
-                db_port=t.database.port if t.database.enabled else None,
-                db_name=t.database.database if t.database.enabled else None,
-                db_user=t.database.username if t.database.enabled else None,
-                db_schema=t.database.schema_name if t.database.enabled else "public",
-                db_allowed_tables=t.database.allowed_tables if t.database.enabled else [],
-                has_db_password=bool(t.database.password_encrypted),
-                docs_enabled=t.documents.enabled,
-                created_at=t.created_at
-            ))
-        return result
+        return [TenantPublicView.model_validate(t) for t in self._tenants.values()]
 
     
     def update_llm_config(self, tenant_id: str, request: TenantUpdateLLMRequest) -> Optional[Tenant]:
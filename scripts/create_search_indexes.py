@@ -0,0 +1,118 @@
+"""
+One-shot migration: search indexes for the MuseumBroker lookups.
+
+The broker filters with ILIKE '%term%' on titles, names, descriptions and
+categories. A leading wildcard can't use a B-tree, so without these indexes
+every search is a sequential scan. pg_trgm GIN indexes serve ILIKE '%term%'
+directly (for terms of 3+ characters), so the broker SQL stays as it is;
+with the extension installed, title lookups are also ranked by similarity().
+Free-text search (general_query) uses stored tsvector columns instead.
+
+Usage:
+    python scripts/create_search_indexes.py <tenant_id>
+
+Indexes are created CONCURRENTLY and IF NOT EXISTS: those statements are online
+and safe to re-run on a live DB. The search_tsv columns are not: on the first run,
+ADD COLUMN ... GENERATED ALWAYS ... STORED rewrites artistwork and artist under an
+ACCESS EXCLUSIVE lock (reads and writes wait until it's done). Run it in a
+maintenance window the first time; later runs find the columns and skip them.
+"""
+import sys
+from sqlalchemy import create_engine, text
+from app.services.tenant_service import tenant_service
+
+# (index name, table, indexed expression)
+TRGM_INDEXES = [
+    ("artistwork_title_trgm", "artistwork", "artistworktitle"),
+    ("artistwork_description_trgm", "artistwork", "artistworkdescription"),
+    ("artist_name_trgm", "artist", "artistname"),
+    ("artist_biography_trgm", "artist", "biography"),
+    ("technique_description_trgm", "technique", "techniquedescription"),
+    ("room_name_trgm", "room", "roomname"),
+    ("artistcategory_description_trgm", "artistcategory", "artistcategorydescription"),
+    ("pathway_name_trgm", "pathway", "pathwayname"),
+]
+
+# Stored full-text vectors for the broker's free-text search (general_query):
+# (table, weight-A column, weight-B column). The broker uses them when present.
+# Adding the column rewrites the table under an ACCESS EXCLUSIVE lock (first run only).
+TSV_COLUMNS = [
+    ("artistwork", "artistworktitle", "artistworkdescription"),
+    ("artist", "artistname", "biography"),
+]
+
+# Prefix lookups (settings.BROKER_PREFIX_MATCH): lower(col) LIKE 'term%' range scans
+PREFIX_INDEXES = [
+    ("room_name_prefix_idx", "room", "roomname"),
+    ("artistcategory_description_prefix_idx", "artistcategory", "artistcategorydescription"),
+    ("technique_description_prefix_idx", "technique", "techniquedescription"),
+]
+
+# Plain B-tree indexes for the exact-match lookups
+BTREE_INDEXES = [
+    ("artistwork_site_inventory_idx", "artistwork", "siteid, inventorynumber"),
+    ("artistwork_site_room_idx", "artistwork", "siteid, roomid"),
+    ("artistcategory_description_idx", "artistcategory", "artistcategorydescription"),
+]
+
+
+def create_search_indexes(tenant_id: str):
+    tenant = tenant_service.get_tenant(tenant_id)
+    if not tenant or tenant.database.db_type != "postgres":
+        print(f"Tenant {tenant_id} not found or not on PostgreSQL")
+        return
+
+    db_uri = tenant_service.get_db_connection_string(tenant_id)
+    schema = tenant.database.schema_name or "guide"
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    engine = create_engine(db_uri, isolation_level="AUTOCOMMIT")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            print("pg_trgm extension ready")
+
+            for name, table, column in TRGM_INDEXES:
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                    f"ON {schema}.{table} USING gin ({column} gin_trgm_ops)"
+                ))
+                print(f"  [OK] {schema}.{name}")
+
+            for table, col_a, col_b in TSV_COLUMNS:
+                conn.execute(text(
+                    f"ALTER TABLE {schema}.{table} ADD COLUMN IF NOT EXISTS search_tsv tsvector "
+                    f"GENERATED ALWAYS AS ("
+                    f"setweight(to_tsvector('simple', coalesce({col_a}, '')), 'A') || "
+                    f"setweight(to_tsvector('simple', coalesce({col_b}, '')), 'B')) STORED"
+                ))
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_search_tsv_idx "
+                    f"ON {schema}.{table} USING gin (search_tsv)"
+                ))
+                print(f"  [OK] {schema}.{table}.search_tsv")
+
+            for name, table, column in PREFIX_INDEXES:
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                    f"ON {schema}.{table} (lower({column}) text_pattern_ops)"
+                ))
+                print(f"  [OK] {schema}.{name}")
+
+            for name, table, columns in BTREE_INDEXES:
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                    f"ON {schema}.{table} ({columns})"
+                ))
+                print(f"  [OK] {schema}.{name}")
+    finally:
+        engine.dispose()
+
+    print("\nSearch indexes created.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python scripts/create_search_indexes.py <tenant_id>")
+        sys.exit(1)
+    create_search_indexes(sys.argv[1])